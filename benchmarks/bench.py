@@ -0,0 +1,251 @@
+"""
+Benchmarks of the hot paths of calc: option pricing and greeks, implied volatilities, yields to maturity,
+bootstrapping, integration and time value of money, at sizes from one to a million instruments.
+
+Each case is run a number of times to report the throughput (instruments per second at the median latency)
+and latency percentiles, then once more under tracemalloc to report the peak memory allocated.
+Results can be saved as a JSON baseline and later compared against it, flagging cases whose minimum latency
+or peak memory grew by more than the tolerance allows.
+
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from calc.bond import Bond, BondBook, bootstrap  # noqa: E402
+from calc.curve import ZeroCurve  # noqa: E402
+from calc.optimize import integrate, quad  # noqa: E402
+from calc.option import Vanilla, VanillaBatch, implied_volatility  # noqa: E402
+from calc.special import npdf  # noqa: E402
+from calc.value import amortization, irr, pv  # noqa: E402
+
+
+def _options(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return (np.full(n, 100.), rng.uniform(70, 130, n), rng.uniform(0.05, 2, n), np.full(n, 0.03),
+            rng.uniform(0.1, 0.5, n), np.zeros(n), rng.random(n) < 0.5)
+
+
+def _bonds(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(1, 31, n).astype(float), rng.uniform(1, 8, n).round(2), rng.uniform(80, 120, n)
+
+
+def vanilla(n: int):
+    S, K, T, r, sigma, q, put = _options(n)
+    return lambda: [Vanilla(S[i], K[i], T[i], r[i], sigma[i], q[i], put[i]).premium for i in range(n)]
+
+
+def vanilla_greeks(n: int):
+    S, K, T, r, sigma, q, put = _options(n)
+    options = [Vanilla(S[i], K[i], T[i], r[i], sigma[i], q[i], put[i]) for i in range(n)]
+    return lambda: [option.greeks() for option in options]
+
+
+def batch_greeks(n: int):
+    S, K, T, r, sigma, q, put = _options(n)
+    return lambda: VanillaBatch(S, K, T, r, sigma, q, put).greeks()
+
+
+def vanilla_implied(n: int):
+    S, K, T, r, sigma, q, put = _options(n)
+    prices = VanillaBatch(S, K, T, r, sigma, q, put).premium
+    return lambda: [Vanilla(S[i], K[i], T[i], r[i], q=q[i], put=put[i], price=prices[i]).sigma for i in range(n)]
+
+
+def batch_implied(n: int):
+    S, K, T, r, sigma, q, put = _options(n)
+    prices = VanillaBatch(S, K, T, r, sigma, q, put).premium
+    return lambda: implied_volatility(prices, S, K, T, r, q, put)
+
+
+def bond_ytm(n: int):
+    T, R, B = _bonds(n)
+    return lambda: [Bond(T[i], R[i], B=B[i]).y for i in range(n)]
+
+
+def book_ytm(n: int):
+    T, R, B = _bonds(n)
+    return lambda: BondBook(T, R, B=B).y
+
+
+def bond_bootstrap(n: int):
+    bonds = [Bond(t / 2, 4, y=0.03 + 0.01 * np.log1p(t / 2)) for t in range(1, n + 1)]
+    return lambda: bootstrap(bonds, 0.015)
+
+
+def curve_bootstrap(n: int):
+    bonds = [Bond(t / 2, 4, y=0.03 + 0.01 * np.log1p(t / 2)) for t in range(1, n + 1)]
+    return lambda: ZeroCurve.bootstrap(bonds, 0.015)
+
+
+def romberg(n: int):
+    rng = np.random.default_rng(0)
+    mu = rng.normal(size=(n, 1))
+    return lambda: integrate(lambda x: npdf(x - mu), -3, 3)
+
+
+def gauss_kronrod(n: int):
+    rng = np.random.default_rng(0)
+    mu = rng.normal(size=(n, 1))
+    return lambda: quad(lambda x: npdf(x - mu), -3, 3)
+
+
+def value_pv(n: int):
+    rng = np.random.default_rng(0)
+    C = rng.uniform(0, 100, (n, 360))
+    y = rng.uniform(0, 0.01, n)
+    return lambda: pv(y, C)
+
+
+def value_amortization(n: int):
+    rng = np.random.default_rng(0)
+    PV, r = rng.uniform(1e5, 5e5, n), rng.uniform(0.03, 0.08, n)
+    return lambda: amortization(PV, 30, r)
+
+
+def value_irr(n: int):
+    rng = np.random.default_rng(0)
+    C = np.concatenate([np.full((n, 1), -100.), rng.uniform(5, 15, (n, 20))], axis=1)
+    return lambda: irr(C)
+
+
+# benchmark cases and the numbers of instruments each is run with;
+# loops over scalar objects stop at smaller sizes than vectorized batches
+CASES = {
+    'vanilla': (vanilla, (1, 1000, 100000)),
+    'vanilla_greeks': (vanilla_greeks, (1, 1000, 100000)),
+    'batch_greeks': (batch_greeks, (1, 1000, 1000000)),
+    'vanilla_implied': (vanilla_implied, (1, 1000, 10000)),
+    'batch_implied': (batch_implied, (1, 1000, 1000000)),
+    'bond_ytm': (bond_ytm, (1, 1000, 10000)),
+    'book_ytm': (book_ytm, (1, 1000, 100000)),
+    'bond_bootstrap': (bond_bootstrap, (4, 20, 60)),
+    'curve_bootstrap': (curve_bootstrap, (4, 20, 60)),
+    'romberg': (romberg, (1, 1000, 100000)),
+    'gauss_kronrod': (gauss_kronrod, (1, 1000, 100000)),
+    'value_pv': (value_pv, (1, 1000, 100000)),
+    'value_amortization': (value_amortization, (1, 1000, 100000)),
+    'value_irr': (value_irr, (1, 1000, 100000)),
+}
+
+
+def measure(run, n: int, repeat: int = 5, budget: float = 2.):
+    """
+    time a benchmark case and measure its peak memory
+
+    :param run: case to run, without arguments
+    :param n: number of instruments of the case
+    :param repeat: minimum number of timed runs
+    :param budget: seconds after which no more runs are started once <repeat> runs are done
+    :return: dictionary of statistics
+    """
+    # contracts the scalar solvers cannot solve are logged on every run, which would be timed as well
+    disabled = logging.root.manager.disable
+    logging.disable(logging.CRITICAL)
+    try:
+        run()  # warm up caches and imports
+        latencies = []
+        start = time.perf_counter()
+        while len(latencies) < repeat or (time.perf_counter() - start < budget and len(latencies) < 100):
+            t = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - t)
+            if len(latencies) >= repeat and time.perf_counter() - start > budget:
+                break
+
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        logging.disable(disabled)
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {'n': n, 'runs': len(latencies), 'throughput': n / p50 if p50 > 0 else float('inf'),
+            'p50': p50, 'p90': p90, 'p99': p99, 'min': min(latencies), 'peak_memory': peak}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2, floor: float = 10e-5):
+    """
+    compare benchmark results against a baseline.
+    Latencies are compared by their minimum, which is far less noisy than the median,
+    and increases of less than <floor> seconds are ignored, as they are mostly timer noise on the smallest cases.
+
+    :param results: results of <main>, keyed by case and size
+    :param baseline: results of an earlier run
+    :param tolerance: relative increase of minimum latency or peak memory flagged as a regression
+    :param floor: smallest increase of minimum latency in seconds flagged as a regression
+    :return: list of regressions, as (key, metric, baseline value, new value)
+    """
+    regressions = []
+    for key, stats in results.items():
+        if key not in baseline:
+            continue
+        for metric, least in (('min', floor), ('peak_memory', 0)):
+            old, new = baseline[key][metric], stats[metric]
+            if new > old * (1 + tolerance) and new - old > least:
+                regressions.append((key, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('cases', nargs='*', help='cases to run, all by default: ' + ', '.join(CASES))
+    parser.add_argument('--max-size', type=int, default=None, help='skip sizes above this number of instruments')
+    parser.add_argument('--repeat', type=int, default=5, help='minimum number of timed runs')
+    parser.add_argument('--save', help='save results to this JSON file')
+    parser.add_argument('--compare', help='compare results against this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative slowdown flagged as regression')
+    parser.add_argument('--floor', type=float, default=10e-5, help='smallest slowdown in seconds flagged as regression')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: ' + ', '.join(sorted(unknown)))
+
+    results = {}
+    print('%-32s %10s %14s %12s %12s %12s %12s' % ('case', 'runs', 'items/s', 'p50 ms', 'p90 ms', 'p99 ms', 'peak MB'))
+    for name in args.cases or CASES:
+        case, sizes = CASES[name]
+        for n in sizes:
+            if args.max_size is not None and n > args.max_size:
+                continue
+            key = '%s[%d]' % (name, n)
+            stats = measure(case(n), n, args.repeat)
+            results[key] = stats
+            print('%-32s %10d %14.1f %12.3f %12.3f %12.3f %12.2f' % (
+                key, stats['runs'], stats['throughput'], stats['p50'] * 1e3, stats['p90'] * 1e3,
+                stats['p99'] * 1e3, stats['peak_memory'] / 2 ** 20))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__,
+                       'machine': platform.machine(), 'results': results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance, args.floor)
+        for key, metric, old, new in regressions:
+            print('REGRESSION %s %s: %.6g -> %.6g (%+.1f%%)' % (key, metric, old, new, (new / old - 1) * 100))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
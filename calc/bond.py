@@ -1,9 +1,11 @@
 import logging
+from functools import lru_cache
 from typing import Sequence
 
 import numpy as np
 
-from calc.optimize import root
+from calc import kernels
+from calc.optimize import WARM_STOP, get_cache, root, root_vec
 
 
 class Bond(object):
@@ -30,6 +32,7 @@ class Bond(object):
         self._m = m
         self._R = R
         self._F = F
+        self.__refresh_schedule__()
 
         if y is not None:
             self._y = y
@@ -39,6 +42,14 @@ class Bond(object):
         else:
             raise ValueError("one of yield to maturity or bond price must be provided")
 
+    def __refresh_schedule__(self):
+        """
+        fetch the coupon times and cash flows of the bond, which only depend on T, m, R and F.
+
+        :return:
+        """
+        self._ts, self._cs, self._tcs, self._ttcs = schedule(self._T, self._m, self._R, self._F)
+
     def __refresh_value_cache__(self):
         """
         recompute cached bond properties.
@@ -46,7 +57,7 @@ class Bond(object):
         :return:
         """
         self.__refresh_primary_cache__()
-        self._d2Bdy2 = np.sum(self._ts * self._ts * self._dcs)
+        self._d2Bdy2 = self._disc @ self._ttcs
         self._duration = -self._dBdy / self._B
         self._convexity = self._d2Bdy2 / self._B
 
@@ -56,13 +67,9 @@ class Bond(object):
 
         :return:
         """
-        self._ts = np.arange(self._T, 0, -1 / self._m)[::-1]
-        self._cs = [self._R * self._F / 100 / self._m for _ in range(len(self._ts))]
-        self._cs[-1] += self._F
-        self._dcs = np.exp(-self._y * self._ts) * self._cs
-
-        self._B = np.sum(self._dcs)
-        self._dBdy = float(np.sum(-self._ts * self._dcs))
+        self._disc = np.exp(-self._y * self._ts)
+        self._B = self._disc @ self._cs
+        self._dBdy = float(-(self._disc @ self._tcs))
 
     @property
     def T(self):
@@ -76,6 +83,7 @@ class Bond(object):
     @T.setter
     def T(self, value):
         self._T = value
+        self.__refresh_schedule__()
         self.__refresh_value_cache__()
 
     @property
@@ -90,6 +98,7 @@ class Bond(object):
     @m.setter
     def m(self, value):
         self._m = value
+        self.__refresh_schedule__()
         self.__refresh_value_cache__()
 
     @property
@@ -104,6 +113,7 @@ class Bond(object):
     @R.setter
     def R(self, value):
         self._R = value
+        self.__refresh_schedule__()
         self.__refresh_value_cache__()
 
     @property
@@ -180,11 +190,30 @@ class Bond(object):
         def df(x: float):
             return self._dBdy
 
+        # start from the previous yield of the bond, or a cached yield of a bond with the same terms,
+        # falling back to the initial guess 0.1 if the warm start does not converge within a few iterations
+        cache = get_cache()
+        key = cache.key('ytm', (self._T, self._m, self._R, self._F), value) if cache is not None else None
+        guess = getattr(self, '_y', None)
+        if guess is None or not np.isfinite(guess):
+            guess = cache.get(key) if cache is not None else None
+        y = None
+        if guess is not None:
+            try:
+                y = root(f, guess, df, epsilon=10e-9, delta=10e-9, stop=WARM_STOP, tag='ytm')
+            except RuntimeError:
+                pass
         try:
-            # compute implied yield to maturity with initial guess = 0.1
-            self.y = root(f, 0.1, df, epsilon=10e-9, delta=10e-9)
+            if y is None:
+                y = root(f, 0.1, df, epsilon=10e-9, delta=10e-9, tag='ytm')
+            self.y = y
         except RuntimeError:
+            # the bond is left without a yield rather than at the last approximation
             logging.error("invalid bond value")
+            self.y = np.nan
+            return
+        if cache is not None:
+            cache.put(key, self._y)
 
     @property
     def F(self):
@@ -198,6 +227,7 @@ class Bond(object):
     @F.setter
     def F(self, value):
         self._F = value
+        self.__refresh_schedule__()
         self.__refresh_value_cache__()
 
     @property
@@ -219,26 +249,320 @@ class Bond(object):
         return self._convexity
 
 
-def find_curve(bond, known: np.array, epsilon: float = 10e-10):
-    t = np.arange(bond.T, 0, - 1. / bond.m)[::-1]
-    c = np.array([bond.R / bond.m] * len(t))
-    c[-1] += bond.F
+class BondBook(object):
+    """
+    Represents a book of coupon paying bonds stored column-wise.
+    Terms are kept in one array per field, and the cash flows of all bonds are laid out back to back
+    in compressed sparse row (CSR) fashion, where the flows of the i-th bond occupy [indptr[i], indptr[i + 1]).
+    Prices, yields to maturity and risk measures of every bond are computed in vectorized passes.
+    Each argument may be a scalar or an array, and they are broadcast against each other.
+    As with <Bond>, yields to maturity shadow bond prices, and face values default to 100.
+    """
+
+    def __init__(self, T, R, m=2, y=None, F=100, B=None):
+        """
+        construct a book of coupon paying bonds
+
+        :param T: times to maturity in years
+        :param R: quoted annual coupon rates
+        :param m: coupon payments per year
+        :param y: (implied) yields to maturity
+        :param F: face values
+        :param B: traded bond prices
+        """
+        T, R, m, F = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(R, dtype=float),
+                                         np.asarray(m, dtype=int), np.asarray(F, dtype=float))
+        if T.ndim > 1:
+            raise ValueError("terms of a bond book must be one dimensional")
+        if np.any(T <= 0):
+            raise ValueError("times to maturity must be positive")
+        self._T, self._R, self._m, self._F = (np.atleast_1d(x).copy() for x in (T, R, m, F))
+        self.__refresh_schedule__()
+
+        if y is not None:
+            self._y = np.array(np.broadcast_to(y, self._T.shape), dtype=float)
+            self.__refresh_value_cache__()
+        elif B is not None:
+            self.B = B
+        else:
+            raise ValueError("one of yield to maturity or bond price must be provided")
+
+    @classmethod
+    def from_bonds(cls, bonds: Sequence[Bond]):
+        """
+        collect individual bonds into a book
+
+        :param bonds: bonds
+        :return: bond book
+        """
+        return cls([b.T for b in bonds], [b.R for b in bonds], [b.m for b in bonds],
+                   y=[b.y for b in bonds], F=[b.F for b in bonds])
+
+    def __refresh_schedule__(self):
+        """
+        lay out the coupon times and cash flows of every bond, the same as <schedule> does for a single bond.
+
+        :return:
+        """
+        step = -1 / self._m
+        # same number of coupons as np.arange(T, 0, -1 / m)
+        n = np.ceil(-self._T / step).astype(int)
+        self._indptr = np.concatenate([[0], np.cumsum(n)])
+        self._owner = np.repeat(np.arange(len(n)), n)
+        pos = np.arange(self._indptr[-1]) - self._indptr[self._owner]
+
+        self._ts = self._T[self._owner] + (n[self._owner] - 1 - pos) * step[self._owner]
+        self._cs = (self._R * self._F / 100 / self._m)[self._owner]
+        self._cs[self._indptr[1:] - 1] += self._F
+        self._tcs = self._ts * self._cs
+        self._ttcs = self._ts * self._tcs
+
+    def __sum__(self, flows):
+        """
+        sum flows bond by bond along the last axis
+
+        :param flows: values laid out as the cash flows
+        :return: sums per bond
+        """
+        return np.add.reduceat(flows, self._indptr[:-1], axis=-1)
+
+    def __refresh_value_cache__(self):
+        """
+        recompute cached properties of every bond,
+        by the compiled kernel of <calc.kernels> when numba is installed, or by reducing the flows otherwise.
+
+        :return:
+        """
+        if kernels.BACKEND == kernels.NUMBA:
+            self._B, self._duration, self._convexity = kernels.bonds(self._ts, self._cs, self._indptr, self._y)
+            self._dBdy = -self._duration * self._B
+            return
+        self.__refresh_primary_cache__()
+        self._d2Bdy2 = self.__sum__(self._disc * self._ttcs)
+        self._duration = -self._dBdy / self._B
+        self._convexity = self._d2Bdy2 / self._B
+
+    def __refresh_primary_cache__(self):
+        """
+        recompute bond values and their first order derivatives with respect to yields.
+
+        :return:
+        """
+        self._disc = np.exp(-self._y[self._owner] * self._ts)
+        self._B = self.__sum__(self._disc * self._cs)
+        self._dBdy = -self.__sum__(self._disc * self._tcs)
+
+    def __gather__(self, i: np.ndarray):
+        """
+        locate the cash flows of a subset of the bonds
+
+        :param i: positions of the bonds in the book
+        :return: positions of their flows, offsets of the flows of each bond among them,
+                 and the position of the owner of each flow within i
+        """
+        n = self._indptr[i + 1] - self._indptr[i]
+        starts = np.concatenate([[0], np.cumsum(n)[:-1]])
+        owner = np.repeat(np.arange(len(i)), n)
+        return np.arange(n.sum()) + (self._indptr[i] - starts)[owner], starts, owner
+
+    def __len__(self):
+        return len(self._T)
+
+    def __getitem__(self, i: int):
+        """
+        materialize a single bond of the book.
+        The bond is detached from the book: changes made to it are not written back.
+
+        :param i: position of the bond in the book
+        :return: bond
+        """
+        return Bond(float(self._T[i]), float(self._R[i]), int(self._m[i]), y=float(self._y[i]), F=float(self._F[i]))
+
+    @property
+    def T(self):
+        return self._T
+
+    @property
+    def m(self):
+        return self._m
+
+    @property
+    def R(self):
+        return self._R
+
+    @property
+    def F(self):
+        return self._F
+
+    @property
+    def indptr(self):
+        """
+        offsets of the cash flows of each bond
+
+        :return:
+        """
+        return self._indptr
+
+    @property
+    def ts(self):
+        """
+        coupon times of all bonds, laid out by <indptr>
+
+        :return:
+        """
+        return self._ts
+
+    @property
+    def cs(self):
+        """
+        cash flows of all bonds, laid out by <indptr>
+
+        :return:
+        """
+        return self._cs
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._y = np.array(np.broadcast_to(value, self._T.shape), dtype=float)
+        self.__refresh_value_cache__()
+
+    @property
+    def ytm(self):
+        return self._y
+
+    @property
+    def B(self):
+        return self._B
+
+    @B.setter
+    def B(self, value):
+        value = np.broadcast_to(np.asarray(value, dtype=float), self._T.shape)
+        dBdy = np.empty(self._T.shape)
+
+        def f(x, i):
+            # only the flows of the bonds that have not converged yet are repriced
+            flows, starts, owner = self.__gather__(i)
+            disc = np.exp(-x[owner] * self._ts[flows])
+            dBdy[i] = -np.add.reduceat(disc * self._tcs[flows], starts)
+            return np.add.reduceat(disc * self._cs[flows], starts) - value[i]
+
+        def df(x, i):
+            return dBdy[i]
+
+        # compute implied yields to maturity with initial guesses = 0.1
+        y, converged, _, _ = root_vec(f, np.full(self._T.shape, 0.1), df, epsilon=10e-9, delta=10e-9, tag='ytm')
+        if not np.all(converged):
+            logging.error("invalid bond values at %s", np.flatnonzero(~converged))
+            y[~converged] = np.nan
+        self.y = y
+
+    @property
+    def current(self):
+        """
+        current yields of the bonds
+
+        :return:
+        """
+        return self._R / 100 * self._F / self._B
+
+    @property
+    def duration(self):
+        """
+        modified durations of the bonds
+
+        :return:
+        """
+        return self._duration
+
+    @property
+    def convexity(self):
+        """
+        convexities of the bonds
+
+        :return:
+        """
+        return self._convexity
+
+    @property
+    def dv01(self):
+        """
+        decrease in bond values for a one basis point increase in yields
+
+        :return:
+        """
+        return -self._dBdy / 10000
+
+    def price(self, shift=0):
+        """
+        value the bonds at shifted yields to maturity, without changing the book.
+        A shift may be a scalar, a vector with one shift per bond,
+        or any array broadcastable against the yields, e.g. (scenarios, 1) for parallel shift scenarios.
+
+        :param shift: yield shifts
+        :return: bond values, shaped as the broadcast of shift and yields
+        """
+        y = self._y + np.asarray(shift, dtype=float)
+        return self.__sum__(np.exp(-y[..., self._owner] * self._ts) * self._cs)
+
+
+@lru_cache(maxsize=4096)
+def schedule(T: float, m: int, R: float, F: float = 100):
+    """
+    Compute the coupon times and cash flows of a coupon paying bond.
+    Schedules are cached (least recently used first out) and shared by every bond with the same terms,
+    so the returned arrays are read-only.
+
+    :param T: time to maturity in years
+    :param m: coupon payments per year
+    :param R: quoted annual coupon rate
+    :param F: face value
+    :return: coupon times, cash flows, and cash flows weighted by times and by squared times
+    """
+    ts = np.arange(T, 0, -1 / m)[::-1]
+    cs = np.full(len(ts), R * F / 100 / m)
+    cs[-1] += F
+    tcs = ts * cs
+    ttcs = ts * tcs
+    for a in (ts, cs, tcs, ttcs):
+        a.flags.writeable = False
+    return ts, cs, tcs, ttcs
+
+
+def find_curve(bond, known: np.array, epsilon: float = 10e-10, B: float = None):
+    """
+    Extend a zero rate curve to the maturity of a bond.
+    The zero rates between the last known rate and the bond maturity lie on a straight line,
+    whose end is solved such that the bond is priced at its value.
+
+    :param bond: bond maturing after the last known rate
+    :param known: zero rates known so far, on a grid of 1 / m years starting at 0
+    :param epsilon: maximum tolerance
+    :param B: bond value to fit, defaults to the value of the bond
+    :return: known zero rates extended to the bond maturity
+    """
+    known = np.asarray(known, dtype=float)
+    B = bond.B if B is None else B
+    t, c, _, _ = schedule(bond.T, bond.m, bond.R, bond.F)
+    k = len(known) - 1
+    # the new rates are a + (x - a) * w, for the last known rate a and the unknown rate x at maturity
+    a = known[-1]
+    w = np.arange(1, len(t) - k + 1) / (len(t) - k)
+    tt, cc = t[k:], c[k:]
+    ctw = cc * tt * w
+    fixed = float(c[:k] @ np.exp(-known[1:] * t[:k])) - B
 
     def f(x: float) -> float:
-        r = np.linspace(x, known[-1], len(t) + 1 - len(known), endpoint=False)[::-1]
-        rr = np.concatenate([known[1:], r])
-        return float(np.sum(c * np.exp(-rr * t))) - bond.B
+        return fixed + float(cc @ np.exp(-(a + (x - a) * w) * tt))
 
     def df(x: float) -> float:
-        r = np.linspace(x, known[-1], len(t) + 1 - len(known), endpoint=False)[::-1]
-        cc = c[len(known) - 1:]
-        tt = t[len(known) - 1:]
-        return float(np.sum(-cc * tt * np.exp(-r * tt) * np.arange(1, len(tt) + 1) / len(tt)))
-
-    x = root(f, 0.05, df=df)
-    r = np.linspace(x, known[-1], len(t) + 1 - len(known), endpoint=False)[::-1]
-    rr = np.concatenate([known[:], r])
-    return rr
+        return -float(ctw @ np.exp(-(a + (x - a) * w) * tt))
+
+    x = root(f, 0.05, df=df, epsilon=epsilon, tag='bootstrap')
+    return np.concatenate([known, a + (x - a) * w])
 
 
 def bootstrap(bonds: Sequence[Bond], overnight: float, epsilon: float = 10e-10):
@@ -0,0 +1,156 @@
+import glob
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Tuple, Union
+
+import numpy as np
+
+from calc.option import implied_forward, implied_volatility, CONVERGED
+from calc.surface import fit_smile, DEGREE
+
+# columns of option chain quote files, such as data/S&P500_ETF_Option_0917.csv
+COLUMNS = ('strike', 'call', 'put')
+
+
+def read_chain(path: str, chunk: int = 65536, memory_map: bool = False):
+    """
+    Read an option chain quote file with a header row naming (at least) the columns Strike, Call and Put,
+    in chunks of rows, so that memory use does not depend on the length of the file.
+    Large files can be memory mapped instead of being read through buffered file objects.
+
+    :param path: csv file of quotes
+    :param chunk: rows per chunk
+    :param memory_map: whether to memory map the file
+    :return: generator of (strikes, call prices, put prices) arrays, one triple per chunk
+    """
+    with open(path, 'rb') as file:
+        if memory_map:
+            view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            lines = iter(view.readline, b'')
+        else:
+            view = None
+            lines = iter(file)
+        try:
+            header = [name.strip().lower() for name in next(lines).decode().split(',')]
+            columns = [header.index(name) for name in COLUMNS]
+            while True:
+                rows = [line.decode() for line in islice(lines, chunk) if line.strip()]
+                if not rows:
+                    break
+                values = np.loadtxt(rows, delimiter=',', usecols=columns, ndmin=2)
+                yield values[:, 0], values[:, 1], values[:, 2]
+        finally:
+            if view is not None:
+                view.close()
+
+
+def load_chain(path: str, chunk: int = 65536, memory_map: bool = False):
+    """
+    Read a whole option chain quote file into columnar arrays, chunk by chunk.
+
+    :param path: csv file of quotes
+    :param chunk: rows per chunk
+    :param memory_map: whether to memory map the file
+    :return: strikes, call prices and put prices
+    """
+    chunks = list(read_chain(path, chunk, memory_map))
+    if not chunks:
+        return np.empty(0), np.empty(0), np.empty(0)
+    return tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+def calibrate(K: np.ndarray, C: np.ndarray, P: np.ndarray, T: float, S: float = None):
+    """
+    Calibrate an option chain of a single expiry:
+    a robust put-call parity regression gives the implied forward and rates r and q, see <implied_forward>,
+    the out-of-the-money options (puts struck below the forward, calls above) give the implied volatilities,
+    all solved at once, and the implied volatilities are fitted by a smile, see <calc.surface.fit_smile>.
+
+    :param K: strikes
+    :param C: call prices
+    :param P: put prices
+    :param T: time to maturity
+    :param S: underlying spot price, or None to use the implied forward as the spot (so that q = r)
+    :return: dictionary of the forward, discount, r, q, and strike, sigma, status and parity inlier flag
+             of each strike, and smile
+    """
+    if len(K) < 2:
+        raise ValueError("at least two strikes are needed to calibrate a chain")
+    F, r, q, inliers = implied_forward(K, C, P, T, S)
+    D = np.exp(-r * T)
+    S = F if S is None else S
+
+    put = K < F
+    sigma, status = implied_volatility(np.where(put, P, C), S, K, T, r, q=q, put=put)
+    ok = status == CONVERGED
+    smile = fit_smile(np.log(K[ok] / F), sigma[ok] ** 2 * T) if np.any(ok) else np.full(DEGREE + 1, np.nan)
+    return {'forward': F, 'discount': D, 'r': r, 'q': q, 'T': T, 'S': S,
+            'strike': K, 'sigma': sigma, 'status': status, 'inlier': inliers, 'smile': smile}
+
+
+def calibrate_file(path: str, T: float, S: float = None, out: str = None, chunk: int = 65536,
+                   memory_map: bool = False):
+    """
+    Load and calibrate the option chain of a quote file, see <calibrate>,
+    and optionally save the result as a compressed numpy archive (.npz).
+
+    :param path: csv file of quotes
+    :param T: time to maturity
+    :param S: underlying spot price
+    :param out: path of the archive to write, or None
+    :param chunk: rows per chunk when reading the file
+    :param memory_map: whether to memory map the file
+    :return: calibration result
+    """
+    K, C, P = load_chain(path, chunk, memory_map)
+    result = calibrate(K, C, P, T, S)
+    if out is not None:
+        np.savez_compressed(out, **result)
+    return result
+
+
+def _calibrate_file(args):
+    """
+    calibrate a quote file within a worker process, reporting failures instead of raising them
+
+    :param args: arguments of <calibrate_file>
+    :return: path of the quote file, and path of the archive written or None if the calibration failed
+    """
+    path = args[0]
+    try:
+        calibrate_file(*args)
+        return path, args[3]
+    except (ValueError, np.linalg.LinAlgError) as e:
+        logging.error("failed to calibrate %s: %s", path, e)
+        return path, None
+
+
+def calibrate_directory(directory: str, terms: Union[Callable[[str], Tuple[float, float]], Tuple[float, float]],
+                        out: str, pattern: str = '*.csv', processes: int = None, chunk: int = 65536,
+                        memory_map: bool = False):
+    """
+    Calibrate every quote file of a directory across a pool of processes,
+    writing one compressed numpy archive per file (same name, .npz extension) to the output directory.
+    Each worker holds one chain at a time, so memory use is bounded by the number of processes
+    times the size of the largest chain.
+
+    :param directory: directory of csv quote files
+    :param terms: (T, S) of every file, or a picklable function of the file name returning them
+    :param out: output directory
+    :param pattern: glob pattern of the quote files
+    :param processes: number of worker processes, defaults to the number of cpus
+    :param chunk: rows per chunk when reading files
+    :param memory_map: whether to memory map the files
+    :return: dictionary from each quote file to the archive written, or None if it failed
+    """
+    os.makedirs(out, exist_ok=True)
+    jobs = []
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        name = os.path.basename(path)
+        T, S = terms(name) if callable(terms) else terms
+        jobs.append((path, T, S, os.path.join(out, os.path.splitext(name)[0] + '.npz'), chunk, memory_map))
+    with ProcessPoolExecutor(processes) as pool:
+        return dict(pool.map(_calibrate_file, jobs))
@@ -0,0 +1,395 @@
+from typing import Sequence
+
+import numpy as np
+
+from calc.bond import Bond, BondBook, find_curve
+
+# interpolation methods of zero rate curves
+LINEAR = "linear"  # linear on zero rates
+LOGLINEAR = "loglinear"  # linear on the logarithm of discount factors
+CUBIC = "cubic"  # natural cubic spline on zero rates
+MONOTONE = "monotone"  # monotone (fritsch-carlson) cubic on zero rates
+METHODS = (LINEAR, LOGLINEAR, CUBIC, MONOTONE)
+
+
+class ZeroCurve(object):
+    """
+    Represents a curve of continuously compounded zero rates.
+    The curve is given by zero rates at node times, interpolated in between by one of the METHODS
+    and flat beyond both ends.
+    Node discount factors and the piecewise cubic coefficients of the interpolant are precomputed,
+    so that each lookup is a binary search and a polynomial evaluation, and lookups accept arrays of times.
+    A curve bootstrapped or fitted from bonds remembers the bonds,
+    so that it can be updated incrementally when quotes change.
+    """
+
+    def __init__(self, times: Sequence[float], rates: Sequence[float], method: str = LINEAR):
+        """
+        construct a zero rate curve
+
+        :param times: increasing node times in years
+        :param rates: zero rates at the node times
+        :param method: interpolation method, one of METHODS
+        """
+        self._t = np.array(times, dtype=float)
+        self._z = np.array(rates, dtype=float)
+        if self._t.shape != self._z.shape or self._t.ndim != 1 or not len(self._t):
+            raise ValueError("node times and zero rates must be one dimensional, non-empty and of equal length")
+        if np.any(np.diff(self._t) <= 0):
+            raise ValueError("node times must be increasing")
+        if method not in METHODS:
+            raise ValueError("unknown interpolation method " + str(method))
+        self._method = method
+        self._bonds = None
+        self._book = None
+        self.__refresh_node_cache__()
+
+    @classmethod
+    def bootstrap(cls, bonds: Sequence[Bond], overnight: float, epsilon: float = 10e-10):
+        """
+        Bootstrap a zero rate curve from the given bonds and bond values, the same way as <calc.bond.bootstrap>.
+        Note that the bonds must have equal coupon payment periods (equal <m>s).
+
+        :param bonds: bonds
+        :param overnight: zero rate at time 0
+        :param epsilon: maximum tolerance
+        :return: zero rate curve
+        """
+        curve = cls.__new__(cls)
+        curve._method = LINEAR
+        curve._book = None
+        curve._bonds = sorted(bonds, key=lambda x: x.T)
+        curve._quotes = np.array([bond.B for bond in curve._bonds], dtype=float)
+        curve._epsilon = epsilon
+        curve._ends = np.zeros(len(curve._bonds), dtype=int)
+        curve._z = np.array([overnight], dtype=float)
+        curve.__rebootstrap__(0)
+        return curve
+
+    def __rebootstrap__(self, start: int):
+        """
+        re-solve the segments of the curve from the <start>-th bond on, keeping the segments before it
+
+        :param start: position of the first bond to re-solve, in increasing order of maturities
+        :return:
+        """
+        known = self._z[:self._ends[start - 1]] if start > 0 else self._z[:1]
+        for i in range(start, len(self._bonds)):
+            known = find_curve(self._bonds[i], known, self._epsilon, B=self._quotes[i])
+            self._ends[i] = len(known)
+        self._z = known
+        self._t = np.arange(len(known)) / self._bonds[0].m
+        self.__refresh_node_cache__()
+
+    @classmethod
+    def fit(cls, bonds: Sequence[Bond], overnight: float = None, method: str = LINEAR,
+            epsilon: float = 10e-9, stop: int = 100):
+        """
+        Fit a zero rate curve to the given bonds and bond values, with one node at the maturity of each bond.
+        Unlike <bootstrap>, all node rates are solved at once by a multidimensional newton's method,
+        so the bonds may have different coupon payment periods and any interpolation method may be used.
+        Bonds must have distinct maturities.
+
+        :param bonds: bonds
+        :param overnight: zero rate at time 0, or None if the curve starts at the shortest maturity
+        :param method: interpolation method, one of METHODS
+        :param epsilon: largest permissible pricing error of any bond when solution is found
+        :param stop: maximum iterations
+        :return: zero rate curve
+        """
+        if method not in METHODS:
+            raise ValueError("unknown interpolation method " + str(method))
+        bonds = sorted(bonds, key=lambda x: x.T)
+        book = BondBook.from_bonds(bonds)
+        if np.any(np.diff(book.T) <= 0):
+            raise ValueError("bonds must have distinct maturities")
+
+        curve = cls.__new__(cls)
+        curve._method = method
+        curve._bonds = bonds
+        curve._book = book
+        curve._quotes = book.B.copy()
+        curve._epsilon = epsilon
+        curve._stop = stop
+        # yields to maturity are the initial guesses of the zero rates at the maturities
+        if overnight is None:
+            curve._t, curve._z = book.T.copy(), book.y.copy()
+        else:
+            curve._t = np.concatenate([[0.], book.T])
+            curve._z = np.concatenate([[overnight], book.y])
+        curve.__refit__()
+        return curve
+
+    def __refit__(self):
+        """
+        solve the node rates of a fitted curve such that every bond is priced at its value,
+        starting from the current node rates
+
+        :return:
+        """
+        ts, cs, starts = self._book.ts, self._book.cs, self._book.indptr[:-1]
+        # the overnight rate, if any, is not solved for
+        free = slice(len(self._z) - len(self._quotes), None)
+        linear = self._method != MONOTONE
+        stop = self._stop
+        self.__refresh_node_cache__()
+        if linear:
+            dzdv = self.__jacobian__(ts)
+
+        while True:
+            zs = self.zero(ts)
+            ds = np.exp(-zs * ts)
+            residuals = np.add.reduceat(cs * ds, starts) - self._quotes
+            if np.max(np.abs(residuals)) <= self._epsilon:
+                break
+            if stop <= 0:
+                raise RuntimeError("zero rate curve did not converge")
+            if not linear:
+                dzdv = self.__jacobian__(ts)
+            J = np.add.reduceat((-cs * ts * ds)[:, None] * dzdv[:, free], starts, axis=0)
+            self._z[free] -= np.linalg.solve(J, residuals)
+            self.__refresh_node_cache__()
+            stop -= 1
+
+    def __refresh_node_cache__(self):
+        """
+        recompute discount factors at the nodes and the coefficients of the interpolant
+
+        :return:
+        """
+        self._zt = self._z * self._t
+        self._df = np.exp(-self._zt)
+        self._coef = _coefficients(self._t, self._zt if self._method == LOGLINEAR else self._z, self._method)
+
+    def __jacobian__(self, t):
+        """
+        derivatives of zero rates at the given times with respect to node zero rates
+
+        :param t: times in years
+        :return: matrix of derivatives, one row per time and one column per node
+        """
+        x = np.clip(t, self._t[0], self._t[-1])
+        n = len(self._t)
+        if self._method == MONOTONE:
+            # monotone interpolation is not linear in the node values, and is differentiated numerically
+            h = 10e-9
+            bumped = _evaluate(self._t, _coefficients(self._t, self._z[:, None] + h * np.eye(n), MONOTONE), x)
+            return (bumped - _evaluate(self._t, self._coef, x)[:, None]) / h
+        if self._method == LOGLINEAR:
+            basis = _evaluate(self._t, _coefficients(self._t, np.diag(self._t), LINEAR), x)
+            return basis / x[:, None]
+        return _evaluate(self._t, _coefficients(self._t, np.eye(n), self._method), x)
+
+    def update(self, i: int, B: float):
+        """
+        Update the value of a bond of a bootstrapped or fitted curve.
+        A bootstrapped curve is only re-solved from that bond's segment on, as earlier segments do not depend on it.
+        A fitted curve is re-solved starting from its current node rates, which usually takes one or two iterations.
+
+        :param i: position of the bond, in increasing order of maturities (as in <bonds>)
+        :param B: new bond value
+        :return:
+        """
+        if self._bonds is None:
+            raise ValueError("curve was not bootstrapped or fitted from bonds")
+        self._quotes[i] = B
+        if self._book is None:
+            self.__rebootstrap__(i)
+        else:
+            self.__refit__()
+
+    @property
+    def bonds(self):
+        """
+        bonds of a bootstrapped curve, in increasing order of maturities
+
+        :return:
+        """
+        return self._bonds
+
+    @property
+    def quotes(self):
+        """
+        bond values the curve was bootstrapped from
+
+        :return:
+        """
+        return self._quotes
+
+    @property
+    def method(self):
+        return self._method
+
+    @property
+    def times(self):
+        return self._t
+
+    @property
+    def rates(self):
+        return self._z
+
+    @property
+    def discounts(self):
+        """
+        discount factors at the node times
+
+        :return:
+        """
+        return self._df
+
+    def zero(self, t):
+        """
+        zero rates at the given times
+
+        :param t: times in years
+        :return:
+        """
+        x = np.clip(t, self._t[0], self._t[-1])
+        v = _evaluate(self._t, self._coef, x)
+        if self._method == LOGLINEAR:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(x > 0, v / x, self._z[0])
+        return v
+
+    def discount(self, t):
+        """
+        discount factors at the given times
+
+        :param t: times in years
+        :return:
+        """
+        return np.exp(-self.zero(t) * t)
+
+    def forward(self, t1, t2):
+        """
+        continuously compounded forward rates between the given times
+
+        :param t1: start times in years
+        :param t2: end times in years
+        :return:
+        """
+        return (self.zero(t2) * t2 - self.zero(t1) * t1) / (np.asarray(t2) - t1)
+
+    def price(self, bonds, shocks=None, tenors: Sequence[float] = None):
+        """
+        Value many bonds at once by discounting their cash flows on the curve,
+        optionally under scenarios of zero rate shocks.
+        Without tenors, each shock is a parallel shift of the curve; with tenors, each shock is a vector
+        of key rate shifts, one per tenor, interpolated linearly between tenors (see <key_rate_durations>).
+        All scenarios are priced by one matrix product and one exponential per cash flow and scenario.
+
+        :param bonds: bond book, or bonds
+        :param shocks: parallel shifts of shape (scenarios...), or key rate shifts of shape (scenarios..., tenors)
+        :param tenors: increasing key rate tenors in years
+        :return: bond values of shape (bonds, scenarios...)
+        """
+        book = bonds if isinstance(bonds, BondBook) else BondBook.from_bonds(bonds)
+        ts, starts = book.ts, book.indptr[:-1]
+        flows = book.cs * self.discount(ts)
+        if shocks is None:
+            return np.add.reduceat(flows, starts)
+        shocks = np.asarray(shocks, dtype=float)
+        if tenors is None:
+            shifts = np.multiply.outer(np.ones_like(ts), shocks)
+        else:
+            shifts = np.tensordot(_key_rate_weights(tenors, ts), shocks, axes=([1], [-1]))
+        shape = (-1,) + (1,) * (shifts.ndim - 1)
+        return np.add.reduceat(flows.reshape(shape) * np.exp(-ts.reshape(shape) * shifts), starts, axis=0)
+
+    def key_rate_durations(self, bonds, tenors: Sequence[float]):
+        """
+        Key rate durations of many bonds at once, -dB/dk / B for a shift k of the zero rate at each tenor.
+        The shift at a tenor fades out linearly to zero at the neighbouring tenors,
+        and is held flat before the first and after the last tenor,
+        so that the key rate durations of a bond add up to its duration against parallel shifts of the curve.
+        Durations are computed analytically from the cash flows, in one pass over the book.
+
+        :param bonds: bond book, or bonds
+        :param tenors: increasing key rate tenors in years
+        :return: matrix of key rate durations, one row per bond and one column per tenor
+        """
+        book = bonds if isinstance(bonds, BondBook) else BondBook.from_bonds(bonds)
+        ts, starts = book.ts, book.indptr[:-1]
+        flows = book.cs * self.discount(ts)
+        sensitivity = np.add.reduceat((ts * flows)[:, None] * _key_rate_weights(tenors, ts), starts, axis=0)
+        return sensitivity / np.add.reduceat(flows, starts)[:, None]
+
+
+def _key_rate_weights(tenors: Sequence[float], t: np.ndarray):
+    """
+    triangular key rate shifts at the given times, for unit shifts at each tenor
+
+    :param tenors: increasing key rate tenors
+    :param t: times in years
+    :return: matrix of shifts, one row per time and one column per tenor
+    """
+    tenors = np.asarray(tenors, dtype=float)
+    if tenors.ndim != 1 or not len(tenors) or np.any(np.diff(tenors) <= 0):
+        raise ValueError("key rate tenors must be one dimensional, non-empty and increasing")
+    eye = np.eye(len(tenors))
+    return np.stack([np.interp(t, tenors, eye[j]) for j in range(len(tenors))], axis=1)
+
+
+def _coefficients(t: np.ndarray, y: np.ndarray, method: str):
+    """
+    compute the coefficients of a piecewise cubic interpolant,
+    y(x) = a + b * h + c * h ** 2 + d * h ** 3 with h = x - t[i] on [t[i], t[i + 1]]
+
+    :param t: increasing node times
+    :param y: node values, or several sets of node values with one column per set
+    :param method: interpolation method, one of METHODS (LOGLINEAR interpolates y linearly)
+    :return: coefficients of shape (intervals, 4) + y.shape[1:]
+    """
+    y = np.asarray(y, dtype=float)
+    if len(t) == 1:
+        return np.stack([y, np.zeros_like(y), np.zeros_like(y), np.zeros_like(y)], axis=1)
+
+    h = np.diff(t).reshape((-1,) + (1,) * (y.ndim - 1))
+    delta = np.diff(y, axis=0) / h
+    a = y[:-1]
+
+    if method in (LINEAR, LOGLINEAR) or len(t) == 2:
+        b, c, d = delta, np.zeros_like(delta), np.zeros_like(delta)
+    elif method == CUBIC:
+        # second derivatives of a natural spline vanish at both ends
+        n = len(t)
+        A = np.zeros((n - 2, n - 2))
+        i = np.arange(n - 2)
+        A[i, i] = (h[:-1] + h[1:]).ravel() / 3
+        A[i[1:], i[:-1]] = h[1:-1].ravel() / 6
+        A[i[:-1], i[1:]] = h[1:-1].ravel() / 6
+        M = np.zeros_like(y)
+        M[1:-1] = np.linalg.solve(A, delta[1:] - delta[:-1])
+        b = delta - h * (2 * M[:-1] + M[1:]) / 6
+        c = M[:-1] / 2
+        d = (M[1:] - M[:-1]) / (6 * h)
+    else:
+        # fritsch-carlson slopes: weighted harmonic means of adjacent secants, zero at local extrema
+        m = np.zeros_like(y)
+        m[0], m[-1] = delta[0], delta[-1]
+        w1 = 2 * h[1:] + h[:-1]
+        w2 = h[1:] + 2 * h[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        m[1:-1] = np.where(delta[:-1] * delta[1:] > 0, harmonic, 0)
+        b = m[:-1]
+        c = (3 * delta - 2 * m[:-1] - m[1:]) / h
+        d = (m[:-1] + m[1:] - 2 * delta) / (h * h)
+
+    return np.stack([a, b, c, d], axis=1)
+
+
+def _evaluate(t: np.ndarray, coef: np.ndarray, x):
+    """
+    evaluate a piecewise cubic interpolant within its nodes
+
+    :param t: increasing node times
+    :param coef: coefficients computed by <_coefficients>
+    :param x: times within [t[0], t[-1]]
+    :return: interpolated values, of shape x.shape + coef.shape[2:]
+    """
+    x = np.asarray(x, dtype=float)
+    i = np.clip(np.searchsorted(t, x, side="right") - 1, 0, len(coef) - 1)
+    h = (x - t[i]).reshape(x.shape + (1,) * (coef.ndim - 2))
+    a, b, c, d = (coef[i, k] for k in range(4))
+    return ((d * h + c) * h + b) * h + a
@@ -0,0 +1,174 @@
+import math
+
+import numpy as np
+
+from calc.special import SQRT2, SQRT2PI, ncdf, npdf
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# backends of the kernels, the compiled one being used by default when numba is installed
+NUMBA = "numba"
+NUMPY = "numpy"
+BACKEND = NUMBA if numba is not None else NUMPY
+
+# rows of the outputs of <vanilla> and <bonds>
+VANILLA = ('premium', 'delta', 'vega', 'gamma', 'theta', 'rho')
+BONDS = ('price', 'duration', 'convexity')
+
+
+def _vanilla_numpy(S, K, T, r, sigma, q, w, out):
+    rootT = np.sqrt(T)
+    srootT = sigma * rootT
+    d1 = (np.log(S / K) + (r - q + 0.5 * sigma ** 2) * T) / srootT
+    d2 = d1 - srootT
+    expnqt = np.exp(-q * T)
+    pvs = S * expnqt
+    pvk = K * np.exp(-r * T)
+    nd1 = npdf(d1)
+    Nwd1 = ncdf(w * d1)
+    Nwd2 = ncdf(w * d2)
+    out[0] = w * (pvs * Nwd1 - pvk * Nwd2)
+    out[1] = w * expnqt * Nwd1
+    out[2] = pvs * rootT * nd1
+    out[3] = expnqt / S / srootT * nd1
+    out[4] = -sigma * pvs / 2 / rootT * nd1 + w * (q * pvs * Nwd1 - r * pvk * Nwd2)
+    out[5] = w * T * pvk * Nwd2
+
+
+def _bonds_numpy(ts, cs, indptr, y, out):
+    owner = np.repeat(np.arange(len(y)), np.diff(indptr))
+    flows = cs * np.exp(-y[owner] * ts)
+    starts = indptr[:-1]
+    out[0] = np.add.reduceat(flows, starts)
+    out[1] = np.add.reduceat(ts * flows, starts) / out[0]
+    out[2] = np.add.reduceat(ts * ts * flows, starts) / out[0]
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True, error_model='numpy')
+    def _vanilla_numba(S, K, T, r, sigma, q, w, out):
+        for i in numba.prange(len(S)):
+            rootT = math.sqrt(T[i])
+            srootT = sigma[i] * rootT
+            d1 = (math.log(S[i] / K[i]) + (r[i] - q[i] + 0.5 * sigma[i] * sigma[i]) * T[i]) / srootT
+            d2 = d1 - srootT
+            expnqt = math.exp(-q[i] * T[i])
+            pvs = S[i] * expnqt
+            pvk = K[i] * math.exp(-r[i] * T[i])
+            nd1 = math.exp(-0.5 * d1 * d1) / SQRT2PI
+            Nwd1 = 0.5 * math.erfc(-w[i] * d1 / SQRT2)
+            Nwd2 = 0.5 * math.erfc(-w[i] * d2 / SQRT2)
+            out[0, i] = w[i] * (pvs * Nwd1 - pvk * Nwd2)
+            out[1, i] = w[i] * expnqt * Nwd1
+            out[2, i] = pvs * rootT * nd1
+            out[3, i] = expnqt / S[i] / srootT * nd1
+            out[4, i] = -sigma[i] * pvs / 2 / rootT * nd1 + w[i] * (q[i] * pvs * Nwd1 - r[i] * pvk * Nwd2)
+            out[5, i] = w[i] * T[i] * pvk * Nwd2
+
+    @numba.njit(parallel=True, cache=True, error_model='numpy')
+    def _bonds_numba(ts, cs, indptr, y, out):
+        for i in numba.prange(len(y)):
+            B = 0.
+            dB = 0.
+            d2B = 0.
+            for j in range(indptr[i], indptr[i + 1]):
+                flow = cs[j] * math.exp(-y[i] * ts[j])
+                B += flow
+                dB += ts[j] * flow
+                d2B += ts[j] * ts[j] * flow
+            out[0, i] = B
+            out[1, i] = dB / B
+            out[2, i] = d2B / B
+
+    _KERNELS = {NUMPY: (_vanilla_numpy, _bonds_numpy), NUMBA: (_vanilla_numba, _bonds_numba)}
+else:
+    _KERNELS = {NUMPY: (_vanilla_numpy, _bonds_numpy)}
+
+
+def vanilla(S, K, T, r, sigma, q=0, put=False, out: np.ndarray = None, backend: str = None):
+    """
+    Compute the premiums and first order greeks of many plain vanilla European options, as <VanillaBatch> does.
+    The compiled kernel computes every output of an option in one pass, without intermediate arrays,
+    and runs in parallel over the options.
+    Parameters may be arrays and are broadcast against each other.
+
+    :param S: underlying spot prices
+    :param K: strike prices
+    :param T: times to maturity
+    :param r: continuously compounded risk-free interest rates
+    :param sigma: black-scholes volatilities
+    :param q: continuously distributed dividend rates
+    :param put: whether each option is a put
+    :param out: output buffer of shape (len(VANILLA), options), reused across calls
+    :param backend: NUMBA or NUMPY, defaults to BACKEND
+    :return: array of shape (len(VANILLA),) + broadcast shape, with one row per name of VANILLA
+    """
+    arrays = np.broadcast_arrays(
+        np.asarray(S, dtype=float), np.asarray(K, dtype=float), np.asarray(T, dtype=float),
+        np.asarray(r, dtype=float), np.asarray(sigma, dtype=float), np.asarray(q, dtype=float),
+        np.where(put, -1., 1.))
+    shape = arrays[0].shape
+    flat = [np.ascontiguousarray(a).ravel() for a in arrays]
+    if out is None:
+        out = np.empty((len(VANILLA), flat[0].size))
+    elif out.shape != (len(VANILLA), flat[0].size):
+        raise ValueError("output buffer must be of shape " + str((len(VANILLA), flat[0].size)))
+    _KERNELS[backend or BACKEND][0](*flat, out)
+    return out.reshape((len(VANILLA),) + shape)
+
+
+def bonds(ts: np.ndarray, cs: np.ndarray, indptr: np.ndarray, y: np.ndarray, out: np.ndarray = None,
+          backend: str = None):
+    """
+    Compute the prices, (modified) durations and convexities of many bonds at once, as <calc.bond.BondBook> does,
+    from cash flows laid out back to back, e.g. <BondBook.ts>, <BondBook.cs> and <BondBook.indptr>.
+    The compiled kernel sums the discounted flows of a bond in one pass and runs in parallel over the bonds.
+
+    :param ts: times of the cash flows
+    :param cs: cash flows
+    :param indptr: the flows of the i-th bond occupy [indptr[i], indptr[i + 1])
+    :param y: yields to maturity
+    :param out: output buffer of shape (len(BONDS), bonds), reused across calls
+    :param backend: NUMBA or NUMPY, defaults to BACKEND
+    :return: array of shape (len(BONDS), bonds), with one row per name of BONDS
+    """
+    y = np.ascontiguousarray(y, dtype=float)
+    if out is None:
+        out = np.empty((len(BONDS), len(y)))
+    elif out.shape != (len(BONDS), len(y)):
+        raise ValueError("output buffer must be of shape " + str((len(BONDS), len(y))))
+    _KERNELS[backend or BACKEND][1](np.ascontiguousarray(ts, dtype=float), np.ascontiguousarray(cs, dtype=float),
+                                    np.ascontiguousarray(indptr, dtype=np.int64), y, out)
+    return out
+
+
+if __name__ == '__main__':
+    import timeit
+
+    from calc.bond import BondBook
+
+    # parity of the backends, and timings of each
+    rng = np.random.default_rng(0)
+    n = 1000000
+    S, K, T = 100., rng.uniform(50, 150, n), rng.uniform(0.05, 3, n)
+    sigma, put = rng.uniform(0.05, 0.8, n), rng.random(n) < 0.5
+    book = BondBook(rng.integers(1, 31, 100000).astype(float), rng.uniform(0, 8, 100000), y=rng.uniform(0, 0.1, 100000))
+
+    reference = vanilla(S, K, T, 0.03, sigma, 0.01, put, backend=NUMPY)
+    expected = np.stack([book.B, book.duration, book.convexity])
+    for backend in _KERNELS:
+        values = vanilla(S, K, T, 0.03, sigma, 0.01, put, backend=backend)
+        error = np.max(np.abs(values - reference) / np.maximum(np.abs(reference), 1), axis=1)
+        print(backend, 'vanilla', dict(zip(VANILLA, error)))
+        values = bonds(book.ts, book.cs, book.indptr, book.y, backend=backend)
+        error = np.max(np.abs(values - expected) / np.abs(expected), axis=1)
+        print(backend, 'bonds', dict(zip(BONDS, error)))
+
+        out = np.empty((len(VANILLA), n))
+        print(backend, 'vanilla', min(timeit.repeat(
+            lambda: vanilla(S, K, T, 0.03, sigma, 0.01, put, out=out, backend=backend), number=1, repeat=5)))
+        print(backend, 'bonds', min(timeit.repeat(
+            lambda: bonds(book.ts, book.cs, book.indptr, book.y, backend=backend), number=1, repeat=5)))
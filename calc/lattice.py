@@ -0,0 +1,175 @@
+import numpy as np
+
+from calc.option import VanillaBatch
+
+
+class Lattice(object):
+    """
+    Represents a batch of plain vanilla options, American or European, priced on binomial (cox-ross-rubinstein)
+    or trinomial (boyle) lattices under the same parameters as <Vanilla>.
+    All parameters may be arrays and are broadcast against each other; every contract shares the same number of steps,
+    so backward induction runs over all contracts at once, in place on a single reused buffer of node values.
+    With smoothing, the last step is replaced by black-scholes values (BBS), and with richardson extrapolation
+    the lattice is also evaluated with half the steps and the two results are combined (BBSR),
+    which reaches a given accuracy with far fewer steps.
+    Delta, gamma and theta are read off the first steps of the same lattice.
+    """
+
+    def __init__(self, S, K, T, r, sigma, q=0, put=False, american: bool = True, steps: int = 200,
+                 trinomial: bool = False, smoothing: bool = True, richardson: bool = True):
+        """
+        construct and price a batch of plain vanilla options
+
+        :param S: underlying spot prices
+        :param K: strike prices
+        :param T: times to maturity
+        :param r: continuously compounded risk-free interest rates
+        :param sigma: black-scholes volatilities
+        :param q: continuously distributed dividend rates
+        :param put: whether each option is a put
+        :param american: whether the options may be exercised early
+        :param steps: number of time steps of the lattice
+        :param trinomial: whether to use a trinomial rather than a binomial lattice
+        :param smoothing: whether to replace the last step by black-scholes values
+        :param richardson: whether to extrapolate from the lattice with half the steps (rounded down)
+        """
+        arrays = np.broadcast_arrays(
+            np.asarray(S, dtype=float), np.asarray(K, dtype=float), np.asarray(T, dtype=float),
+            np.asarray(r, dtype=float), np.asarray(sigma, dtype=float), np.asarray(q, dtype=float),
+            np.asarray(put, dtype=bool))
+        shape = arrays[0].shape
+        args = [a.ravel() for a in arrays] + [american, trinomial, smoothing]
+        # greeks are read off the first three steps, which come before the smoothed step
+        if steps // (2 if richardson else 1) < (4 if smoothing else 3):
+            raise ValueError("too few steps")
+
+        values = _induct(*args, steps)
+        if richardson:
+            # the error is first order in 1 / steps, which also holds when half the steps is rounded down
+            half = steps // 2
+            values = (steps * values - half * _induct(*args, half)) / (steps - half)
+        self._premium, self._delta, self._gamma, self._theta = (v.reshape(shape) for v in values)
+
+    @property
+    def premium(self):
+        return self._premium
+
+    @property
+    def delta(self):
+        """
+        first order derivative of option values with respect to underlying spot prices
+
+        :return:
+        """
+        return self._delta
+
+    @property
+    def gamma(self):
+        """
+        second order derivative of option values twice with respect to underlying spot prices
+
+        :return:
+        """
+        return self._gamma
+
+    @property
+    def theta(self):
+        """
+        first order derivative of option values with respect to the passage of time
+
+        :return:
+        """
+        return self._theta
+
+    def greeks(self):
+        """
+        premiums and greeks of the options
+
+        :return: dictionary of arrays
+        """
+        return {'premium': self._premium, 'delta': self._delta, 'gamma': self._gamma, 'theta': self._theta}
+
+
+def _induct(S, K, T, r, sigma, q, put, american, trinomial, smoothing, n):
+    """
+    backward induction of flat arrays of contracts on lattices of n steps
+
+    :return: premiums, deltas, gammas and thetas
+    """
+    dt = T / n
+    disc = np.exp(-r * dt)[:, None]
+    w = np.where(put, -1., 1.)[:, None]
+    if trinomial:
+        # node i of step j lies at S * u ** (i - j)
+        a = np.exp((r - q) * dt / 2)
+        b = np.exp(sigma * np.sqrt(dt / 2))
+        pu = ((a - 1 / b) / (b - 1 / b)) ** 2
+        pd = ((b - a) / (b - 1 / b)) ** 2
+        pm = 1 - pu - pd
+        pu, pm, pd = pu[:, None] * disc, pm[:, None] * disc, pd[:, None] * disc
+        lnu = 2 * np.log(b)
+        width = 2 * n + 1
+    else:
+        # node i of step j lies at S * u ** (2 * i - j)
+        lnu = sigma * np.sqrt(dt)
+        u = np.exp(lnu)
+        pu = (np.exp((r - q) * dt) - 1 / u) / (u - 1 / u)
+        pu, pd = pu[:, None] * disc, (1 - pu)[:, None] * disc
+        width = n + 1
+    lnu, K = lnu[:, None], K[:, None]
+
+    # every node of the lattice lies at one of the price levels S * u ** k for k = -n, ..., n,
+    # so the exercise values of all nodes are computed once
+    levels = np.exp(np.log(S)[:, None] + lnu * np.arange(-n, n + 1))
+    exercise = np.maximum(w * (levels - K), 0)
+
+    def nodes(j):
+        return slice(n - j, n + j + 1, 1 if trinomial else 2)
+
+    # node values and scratch buffer, reused by every step
+    v = np.empty((len(S), width))
+    scratch = np.empty((len(S), width))
+
+    last = n - 1 if smoothing else n
+    m = 2 * last + 1 if trinomial else last + 1
+    if smoothing:
+        v[:, :m] = VanillaBatch(levels[:, nodes(last)], K, dt[:, None], r[:, None], sigma[:, None], q[:, None],
+                                put[:, None]).premium
+        if american:
+            np.maximum(v[:, :m], exercise[:, nodes(last)], out=v[:, :m])
+    else:
+        v[:, :m] = exercise[:, nodes(last)]
+
+    saved = {}
+    for j in range(last - 1, -1, -1):
+        m = 2 * j + 1 if trinomial else j + 1
+        x = scratch[:, :m]
+        if trinomial:
+            np.multiply(pu, v[:, 2:m + 2], out=x)
+            x += pm * v[:, 1:m + 1]
+        else:
+            np.multiply(pu, v[:, 1:m + 1], out=x)
+        v[:, :m] *= pd
+        v[:, :m] += x
+        if american:
+            np.maximum(v[:, :m], exercise[:, nodes(j)], out=v[:, :m])
+        if j <= 2:
+            saved[j] = v[:, :m].copy()
+
+    S = S[:, None]
+    if trinomial:
+        s1 = S * np.exp(lnu * np.array([-1, 0, 1]))
+        v1 = saved[1]
+        delta = (v1[:, 2] - v1[:, 0]) / (s1[:, 2] - s1[:, 0])
+        gamma = ((v1[:, 2] - v1[:, 1]) / (s1[:, 2] - s1[:, 1]) - (v1[:, 1] - v1[:, 0]) / (s1[:, 1] - s1[:, 0])) \
+                / ((s1[:, 2] - s1[:, 0]) / 2)
+        theta = (v1[:, 1] - saved[0][:, 0]) / dt
+    else:
+        s1 = S * np.exp(lnu * np.array([-1, 1]))
+        s2 = S * np.exp(lnu * np.array([-2, 0, 2]))
+        v1, v2 = saved[1], saved[2]
+        delta = (v1[:, 1] - v1[:, 0]) / (s1[:, 1] - s1[:, 0])
+        gamma = ((v2[:, 2] - v2[:, 1]) / (s2[:, 2] - s2[:, 1]) - (v2[:, 1] - v2[:, 0]) / (s2[:, 1] - s2[:, 0])) \
+                / ((s2[:, 2] - s2[:, 0]) / 2)
+        theta = (v2[:, 1] - saved[0][:, 0]) / (2 * dt)
+    return np.stack([saved[0][:, 0], delta, gamma, theta])
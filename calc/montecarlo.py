@@ -0,0 +1,199 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from calc.option import Vanilla
+
+
+class European(object):
+    """
+    payoff of a plain vanilla European option
+    """
+
+    def __init__(self, K: float, put: bool = False):
+        """
+        :param K: strike price
+        :param put: whether the option is a put
+        """
+        self.K = K
+        self.put = put
+
+    def __call__(self, paths: np.ndarray):
+        """
+        :param paths: simulated prices, one row per path from the spot price to maturity
+        :return: payoff of each path
+        """
+        return np.maximum(self.K - paths[:, -1] if self.put else paths[:, -1] - self.K, 0)
+
+
+class Asian(object):
+    """
+    payoff of an arithmetic average price option, averaging over every simulated date after the spot date
+    """
+
+    def __init__(self, K: float, put: bool = False):
+        """
+        :param K: strike price
+        :param put: whether the option is a put
+        """
+        self.K = K
+        self.put = put
+
+    def __call__(self, paths: np.ndarray):
+        average = paths[:, 1:].mean(axis=1)
+        return np.maximum(self.K - average if self.put else average - self.K, 0)
+
+
+class Barrier(object):
+    """
+    payoff of a knock-in or knock-out barrier option, monitored at every simulated date
+    """
+
+    def __init__(self, K: float, H: float, up: bool = True, out: bool = True, put: bool = False):
+        """
+        :param K: strike price
+        :param H: barrier
+        :param up: whether the barrier is hit from below (up) or from above (down)
+        :param out: whether hitting the barrier knocks the option out or in
+        :param put: whether the option is a put
+        """
+        self.K = K
+        self.H = H
+        self.up = up
+        self.out = out
+        self.put = put
+
+    def __call__(self, paths: np.ndarray):
+        hit = np.any(paths >= self.H, axis=1) if self.up else np.any(paths <= self.H, axis=1)
+        alive = ~hit if self.out else hit
+        return np.where(alive, np.maximum(self.K - paths[:, -1] if self.put else paths[:, -1] - self.K, 0), 0)
+
+
+class Lookback(object):
+    """
+    payoff of a floating strike lookback option, struck at the minimum (call) or maximum (put) simulated price
+    """
+
+    def __init__(self, put: bool = False):
+        """
+        :param put: whether the option is a put
+        """
+        self.put = put
+
+    def __call__(self, paths: np.ndarray):
+        return paths.max(axis=1) - paths[:, -1] if self.put else paths[:, -1] - paths.min(axis=1)
+
+
+def _simulate(args):
+    """
+    simulate a chunk of geometric brownian motion paths and sum the statistics of their discounted payoffs
+
+    :param args: payoff, S, T, r, sigma, q, steps, paths, antithetic, control, seed sequence
+    :return: number of samples, and sums of y, y ** 2, x, x ** 2 and x * y,
+             for discounted payoffs y and discounted control payoffs x
+    """
+    payoff, S, T, r, sigma, q, steps, n, antithetic, control, seed = args
+    generator = np.random.default_rng(seed)
+    dt = T / steps
+    z = generator.standard_normal((n // 2 if antithetic else n, steps))
+    if antithetic:
+        z = np.concatenate([z, -z])
+    paths = np.empty((len(z), steps + 1))
+    paths[:, 0] = 0
+    np.cumsum((r - q - sigma ** 2 / 2) * dt + sigma * np.sqrt(dt) * z, axis=1, out=paths[:, 1:])
+    paths = S * np.exp(paths, out=paths)
+
+    discount = np.exp(-r * T)
+    y = discount * payoff(paths)
+    x = discount * control(paths) if control is not None else np.zeros_like(y)
+    if antithetic:
+        # antithetic pairs are averaged into independent samples
+        half = len(y) // 2
+        y = (y[:half] + y[half:]) / 2
+        x = (x[:half] + x[half:]) / 2
+    return np.array([len(y), y.sum(), y @ y, x.sum(), x @ x, x @ y])
+
+
+def price(payoff: Callable[[np.ndarray], np.ndarray], S: float, T: float, r: float, sigma: float, q: float = 0,
+          steps: int = 252, paths: int = 100000, chunk: int = 10000, antithetic: bool = True,
+          control: Vanilla = None, target: float = None, seed: int = None, processes: int = None):
+    """
+    Price a (path dependent) option by Monte Carlo simulation of geometric brownian motion,
+    under the same assumptions as <Vanilla>.
+    Paths are simulated in chunks of fixed size, so memory use does not depend on the number of paths,
+    and each chunk draws from its own child of one seed sequence, so results are reproducible
+    whatever the number of processes.
+    Antithetic variates pair every path with its mirror image.
+    If a <Vanilla> option on the same underlying is given as control variate, its closed form premium corrects
+    the estimate by the (optimally weighted) error of its own simulated price.
+    If a target standard error is given, simulation stops as soon as it is reached.
+
+    :param payoff: picklable function of simulated paths (one row per path, from spot to maturity)
+                   returning the payoff of each path, e.g. European, Asian, Barrier or Lookback
+    :param S: underlying spot price
+    :param T: time to maturity
+    :param r: continuously compounded risk-free interest rate
+    :param sigma: black-scholes volatility
+    :param q: continuously distributed dividend rate
+    :param steps: simulated dates per path, equally spaced until maturity
+    :param paths: maximum number of paths, rounded up to an even number with antithetic variates
+    :param chunk: paths per chunk
+    :param antithetic: whether to use antithetic variates
+    :param control: plain vanilla European option used as control variate
+    :param target: target standard error
+    :param seed: seed of the random number generators
+    :param processes: number of worker processes, or None to simulate in the calling process
+    :return: estimated price, its standard error, and the number of paths simulated
+    """
+    if control is not None:
+        if (control.S, control.T, control.r, control.sigma, control.q) != (S, T, r, sigma, q):
+            raise ValueError("control variate must be an option on the same underlying and maturity")
+        expected = control.premium
+        control = European(control.K, control.put)
+    if antithetic and chunk % 2:
+        chunk += 1
+
+    chunks = -(-paths // chunk)
+    seeds = np.random.SeedSequence(seed).spawn(chunks)
+    # the last chunk only simulates the remaining paths
+    sizes = [chunk] * (chunks - 1) + [paths - (chunks - 1) * chunk]
+    if antithetic:
+        sizes[-1] += sizes[-1] % 2
+    jobs = [(payoff, S, T, r, sigma, q, steps, n, antithetic, control, s) for n, s in zip(sizes, seeds)]
+    # chunks are simulated in rounds, one chunk per process, so that the target error is checked regularly
+    width = 1 if processes is None else processes
+    pool = ProcessPoolExecutor(processes) if processes is not None else None
+    sums = np.zeros(6)
+    try:
+        for i in range(0, chunks, width):
+            results = pool.map(_simulate, jobs[i:i + width]) if pool is not None else map(_simulate, jobs[i:i + width])
+            for result in results:
+                sums += result
+            estimate, error = _estimate(sums, expected if control is not None else None)
+            if target is not None and error <= target:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    n = int(sums[0])
+    return estimate, error, n * 2 if antithetic else n
+
+
+def _estimate(sums: np.ndarray, expected: float = None):
+    """
+    estimate the price and its standard error from the sums of simulated statistics
+
+    :param sums: sums returned by <_simulate>
+    :param expected: closed form price of the control variate, if any
+    :return: estimated price and its standard error
+    """
+    n, sy, syy, sx, sxx, sxy = sums
+    my, mx = sy / n, sx / n
+    vy = max(syy / n - my * my, 0)
+    if expected is None:
+        return my, np.sqrt(vy / n)
+    vx = max(sxx / n - mx * mx, 0)
+    cxy = sxy / n - mx * my
+    beta = cxy / vx if vx > 0 else 0
+    return my - beta * (mx - expected), np.sqrt(max(vy - beta * cxy, 0) / n)
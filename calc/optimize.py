@@ -1,10 +1,153 @@
+import time
+from collections import OrderedDict
 from typing import Callable, Any
 
 import numpy as np
 
 
+# process-wide monitor of solvers, see <set_monitor>
+_monitor = None
+
+
+def set_monitor(callback: Callable[[dict], Any] = None):
+    """
+    Install a process-wide monitor, called with a report of every solve made by <root> and <root_vec>,
+    unless the solve was given its own callback.
+    Reports are dictionaries of
+    tag (the caller, e.g. 'ytm', 'implied' or 'bootstrap'), method ('newton' or 'secant'),
+    size (number of equations), converged (number of equations solved), iterations and evaluations
+    (numbers of newton/secant steps and of calls to f and df, summed over equations),
+    residual (largest absolute value of f at the returned approximations) and time (wall time in seconds).
+    Solvers do no bookkeeping at all while there is no monitor and no callback.
+
+    :param callback: function of a report, e.g. a <SolverStats>, or None to remove the monitor
+    :return: the previous monitor
+    """
+    global _monitor
+    previous, _monitor = _monitor, callback
+    return previous
+
+
+class SolverStats(object):
+    """
+    Collects solver reports (see <set_monitor>) into statistics per caller tag,
+    such as the number of solves, failures, iterations and evaluations, and the time spent.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    def __call__(self, report: dict):
+        stats = self._stats.get(report['tag'])
+        if stats is None:
+            stats = self._stats[report['tag']] = {'calls': 0, 'size': 0, 'failures': 0, 'iterations': 0,
+                                                  'evaluations': 0, 'time': 0., 'residual': 0.}
+        stats['calls'] += 1
+        stats['size'] += report['size']
+        stats['failures'] += report['size'] - report['converged']
+        stats['iterations'] += report['iterations']
+        stats['evaluations'] += report['evaluations']
+        stats['time'] += report['time']
+        stats['residual'] = max(stats['residual'], report['residual'])
+
+    def summary(self):
+        """
+        statistics per caller tag, with the mean iterations per equation
+
+        :return: dictionary from tags to dictionaries of statistics
+        """
+        return {tag: dict(stats, mean_iterations=stats['iterations'] / stats['size'] if stats['size'] else 0.)
+                for tag, stats in self._stats.items()}
+
+    def reset(self):
+        self._stats.clear()
+
+
+class SolutionCache(object):
+    """
+    Bounded cache of solutions of repeated solves, such as yields to maturity or implied volatilities,
+    keyed by the terms of the instrument and its price rounded to a number of decimals,
+    so that a new instrument quoted close to a recently solved one starts from its solution.
+    The least recently used solutions are evicted first.
+    """
+
+    def __init__(self, maxsize: int = 65536, decimals: int = 2):
+        """
+        :param maxsize: maximum number of solutions kept
+        :param decimals: decimals of the prices in the keys
+        """
+        self._maxsize = maxsize
+        self._decimals = decimals
+        self._solutions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, tag: str, terms: tuple, price: float):
+        """
+        key of a solve
+
+        :param tag: kind of solve, e.g. 'ytm' or 'implied'
+        :param terms: terms of the instrument
+        :param price: price of the instrument
+        :return:
+        """
+        return (tag,) + tuple(terms) + (round(float(price), self._decimals),)
+
+    def get(self, key, default=None):
+        solution = self._solutions.get(key)
+        if solution is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._solutions.move_to_end(key)
+        return solution
+
+    def put(self, key, solution):
+        self._solutions[key] = solution
+        self._solutions.move_to_end(key)
+        if len(self._solutions) > self._maxsize:
+            self._solutions.popitem(last=False)
+
+    def clear(self):
+        self._solutions.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._solutions)
+
+
+# process-wide cache of solutions, see <set_cache>
+_cache = None
+
+# iterations allowed to a solve started from a previous solution before falling back to a cold start
+WARM_STOP = 20
+
+
+def set_cache(cache: SolutionCache = None):
+    """
+    Install a process-wide cache of solutions, used to warm-start the yield to maturity solves of <Bond>
+    and the implied volatility solves of <Vanilla> for instruments without a previous solution of their own.
+
+    :param cache: solution cache, or None to remove the cache
+    :return: the previous cache
+    """
+    global _cache
+    previous, _cache = _cache, cache
+    return previous
+
+
+def get_cache():
+    """
+    the process-wide cache of solutions, see <set_cache>
+
+    :return: solution cache, or None
+    """
+    return _cache
+
+
 def root(f: Callable[[float], float], x0: float, df: Callable[[float], float] = None,
-         epsilon: float = 10e-9, delta: float = 10e-6, stop: int = 10e3, xn1: float = None, progress=False):
+         epsilon: float = 10e-9, delta: float = 10e-6, stop: int = 10e3, xn1: float = None, progress=False,
+         callback: Callable[[dict], Any] = None, tag: str = None):
     """
     find a root of the function, using the newton's method if derivative is available, or the secant method if not.
 
@@ -16,17 +159,24 @@ def root(f: Callable[[float], float], x0: float, df: Callable[[float], float] =
     :param stop: maximum iterations
     :param xn1: one of the first initial guesses needed to initialize secant method
     :param progress: whether to print the convergence progress
+    :param callback: function called with a report of the solve, instead of the monitor (see <set_monitor>)
+    :param tag: name of the caller in the report
 
 
     :return: a root
+    :raises RuntimeError: if no root is found within <stop> iterations, or the approximation is no longer finite
     """
+    report = callback if callback is not None else _monitor
+    if report is not None:
+        start = time.perf_counter()
+    iterations = stop
     if df is None:
         # secant method
         if xn1 is None:
             xn1 = x0 + 0.1
         new, old = x0, xn1
         fnx, fox = f(new), f(old)
-        while (abs(fnx > epsilon) or abs(new - old) > delta) and stop > 0:
+        while (abs(fnx) > epsilon or abs(new - old) > delta) and stop > 0 and np.isfinite(new):
             if progress:
                 print(new)
             oldest = old
@@ -34,41 +184,273 @@ def root(f: Callable[[float], float], x0: float, df: Callable[[float], float] =
             new = old - fnx * (old - oldest) / (fnx - fox)
             fnx, fox = f(new), f(old)
             stop -= 1
+        fx = fnx
     else:
         # newton method
         new, old = x0, x0 + 1
         fx, dfx = f(new), df(new)
-        while (abs(fx > epsilon) or abs(new - old) > delta) and stop > 0:
+        while (abs(fx) > epsilon or abs(new - old) > delta) and stop > 0 and np.isfinite(new):
             old = new
             new = old - fx / dfx
             fx, dfx = f(new), df(new)
             stop -= 1
             if progress:
                 print(new)
+    iterations -= stop
+    converged = abs(fx) <= epsilon and abs(new - old) <= delta
+
+    if report is not None:
+        report({'tag': tag, 'method': 'secant' if df is None else 'newton', 'size': 1, 'converged': int(converged),
+                'iterations': int(iterations), 'evaluations': int(2 * (iterations + 1)), 'residual': float(abs(fx)),
+                'time': time.perf_counter() - start})
+    if not converged:
+        raise RuntimeError("root not found within %d iterations, last approximation %r" % (iterations, new))
     return new
 
 
-def integrate(f: Callable[[float], float], a: float, b: float, epsilon: float = 10e-8, stop: int = 10e3):
+def root_vec(f: Callable[[np.ndarray, np.ndarray], np.ndarray], x0,
+             df: Callable[[np.ndarray, np.ndarray], np.ndarray] = None, epsilon: float = 10e-9,
+             delta: float = 10e-6, stop: int = 10e3, xn1=None, lower=None, upper=None,
+             callback: Callable[[dict], Any] = None, tag: str = None):
     """
-    calculate the definite integral of a function
+    find the roots of many independent equations at once,
+    using the newton's method if derivative is available, or the secant method if not.
+    f and df are vectorized and called as f(x, i), where x holds the current approximations of the elements
+    that have not converged yet and i holds their (flat) indices, so that f can select its own parameters.
+    Elements are frozen as soon as they converge and are no longer evaluated.
+    If <lower> and <upper> are given, every element keeps a bracket [lower, upper] around its root,
+    which is tightened at each iteration, and takes a bisection step whenever the newton/secant step
+    leaves the bracket or is not finite.
+    Brackets are ignored for elements whose f(lower) and f(upper) have the same sign.
+    Elements whose approximation is no longer finite are frozen as not converged.
 
-    :param f: function
+    :param f: vectorized function
+    :param x0: initial guesses for the solutions of f(x) = 0
+    :param df: vectorized derivative of f(x)
+    :param epsilon: largest permissible value of abs(f(x)) when solution is found
+    :param delta: largest permissible distance between two consecutive approximations when solution is found
+    :param stop: maximum iterations
+    :param xn1: the second initial guesses needed to initialize secant method
+    :param lower: one end of the bracket of each root
+    :param upper: the other end of the bracket of each root
+    :param callback: function called with a report of the solve, instead of the monitor (see <set_monitor>)
+    :param tag: name of the caller in the report
+    :return: roots, convergence flags, iteration counts and residuals f(x), each shaped as x0
+    """
+    report = callback if callback is not None else _monitor
+    if report is not None:
+        start = time.perf_counter()
+    shape = np.shape(x0)
+    x = np.array(x0, dtype=float).ravel()
+    idx = np.arange(x.size)
+    roots = x.copy()
+    converged = np.zeros(x.size, dtype=bool)
+    iterations = np.zeros(x.size, dtype=int)
+    residuals = np.full(x.size, np.nan)
+
+    bracketed = lower is not None and upper is not None
+    if bracketed:
+        lo = np.array(np.broadcast_to(lower, shape), dtype=float).ravel()
+        hi = np.array(np.broadcast_to(upper, shape), dtype=float).ravel()
+        slo = np.sign(f(lo, idx))
+        valid = slo * np.sign(f(hi, idx)) < 0
+        lo[~valid], hi[~valid] = -np.inf, np.inf
+
+    if df is None:
+        xp = x + 0.1 if xn1 is None else np.array(np.broadcast_to(xn1, shape), dtype=float).ravel()
+        fp = f(xp, idx)
+    fx = f(x, idx)
+
+    while idx.size and stop > 0:
+        if df is None:
+            new = x - fx * (x - xp) / (fx - fp)
+        else:
+            new = x - fx / df(x, idx)
+
+        if bracketed:
+            # the approximation replaces the end of the bracket whose function value has the same sign
+            same = np.sign(fx) == slo
+            lo = np.where(same, x, lo)
+            hi = np.where(same, hi, x)
+            bad = ~(np.isfinite(new) & ((new - lo) * (new - hi) < 0)) & np.isfinite(lo) & np.isfinite(hi)
+            new[bad] = (lo[bad] + hi[bad]) / 2
+
+        fnew = f(new, idx)
+        iterations[idx] += 1
+        done = (np.abs(fnew) <= epsilon) & (np.abs(new - x) <= delta)
+        roots[idx[done]] = new[done]
+        residuals[idx[done]] = fnew[done]
+        converged[idx[done]] = True
+
+        # elements whose approximation is no longer finite cannot recover and are frozen as well
+        lost = ~done & ~(np.isfinite(new) & np.isfinite(fnew))
+        roots[idx[lost]] = new[lost]
+        residuals[idx[lost]] = fnew[lost]
+
+        keep = ~(done | lost)
+        if df is None:
+            xp, fp = x[keep], fx[keep]
+        if bracketed:
+            lo, hi, slo = lo[keep], hi[keep], slo[keep]
+        idx, x, fx = idx[keep], new[keep], fnew[keep]
+        stop -= 1
+
+    roots[idx] = x
+    residuals[idx] = fx
+    if report is not None:
+        # every element evaluates f at its initial guesses and brackets, then f (and df) once per iteration
+        setup = (1 if df is not None else 2) + (2 if bracketed else 0)
+        steps = int(iterations.sum())
+        report({'tag': tag, 'method': 'secant' if df is None else 'newton', 'size': len(roots),
+                'converged': int(converged.sum()), 'iterations': steps,
+                'evaluations': setup * len(roots) + steps * (1 if df is None else 2),
+                'residual': float(np.nanmax(np.abs(residuals), initial=0.)), 'time': time.perf_counter() - start})
+    return roots.reshape(shape), converged.reshape(shape), iterations.reshape(shape), residuals.reshape(shape)
+
+
+def integrate(f: Callable[[Any], Any], a: float, b: float, epsilon: float = 10e-8, stop: int = 20,
+              full_output: bool = False):
+    """
+    calculate the definite integral of a function using romberg's method.
+    The step of the trapezoidal rule is halved at each iteration, evaluating the function at the new midpoints only,
+    and the trapezoidal sums are extrapolated by richardson's method (the first extrapolation being simpson's method).
+    f is called with arrays of points. If it returns an array whose last axis runs along the points,
+    e.g. one row per parameter set, all the integrands are integrated at once until every one of them converges.
+    Iterations stop early if the error estimate is no longer finite, e.g. at a singularity of f.
+
+    :param f: vectorized function
     :param a: left endpoint
     :param b: right endpoint
     :param epsilon: maximum tolerance
-    :param stop: maximum iterations
+    :param stop: maximum iterations, each doubling the number of partitions
+    :param full_output: whether to also return the error estimate and the number of function evaluations
 
-    :return: approximated definite integral with error less than epsilon
+    :return: approximated definite integral with error less than epsilon,
+             followed by the error estimate and the number of evaluations if full_output is set
     """
-    old = simpsons(f, a, b, 4)
-    new = simpsons(f, a, b, 8)
-    n = 8
-    while abs(old - new) > epsilon and stop > 0:
-        old = new
+    h = b - a
+    y = f(np.array([a, b], dtype=float))
+    t = h * (y[..., 0] + y[..., 1]) / 2
+    evaluations, n = 2, 1
+    row = [t]
+    error = np.inf
+    while stop > 0:
+        h /= 2
+        t = t / 2 + h * np.sum(f(a + h * np.arange(1, 2 * n, 2)), axis=-1)
+        evaluations += n
         n *= 2
-        new = simpsons(f, a, b, n)
+        new = [t]
+        for k in range(len(row)):
+            new.append(new[k] + (new[k] - row[k]) / (4 ** (k + 1) - 1))
+        error = np.max(np.abs(new[-1] - row[-1]))
+        row = new
+        # at least 8 partitions are sampled before convergence is tested, as simpson's method used to be
+        if n >= 8 and error <= epsilon or not np.isfinite(error):
+            break
         stop -= 1
-    return new
+    if full_output:
+        return row[-1], error, evaluations
+    return row[-1]
+
+
+# nodes and weights of the 15-point gauss-kronrod rule, and of the 7-point gauss rule embedded in it
+_XGK = np.array([0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+                 0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+                 0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+                 0.207784955007898467600689403773245, 0.])
+_WGK = np.array([0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+                 0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+                 0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+                 0.204432940075298892414161999234649, 0.209482141084727828012999174891714])
+_WG = np.array([0.129484966168869693270611432679082, 0.279705391489276667901467771423780,
+                0.381830050505118944950369775488975, 0.417959183673469387755102040816327])
+_GK_NODES = np.concatenate([-_XGK[:-1], _XGK[::-1]])
+_GK_WEIGHTS = np.concatenate([_WGK[:-1], _WGK[::-1]])
+_G_WEIGHTS = np.zeros(15)
+_G_WEIGHTS[1:7:2] = _WG[:-1]
+_G_WEIGHTS[7] = _WG[-1]
+_G_WEIGHTS[9::2] = _WG[-2::-1]
+
+
+def quad(f: Callable[[Any], Any], a: float, b: float, epsilon: float = 10e-8, stop: int = 50,
+         full_output: bool = False):
+    """
+    calculate the definite integral of a function using adaptive gauss-kronrod quadrature.
+    Each interval is integrated by the 15-point kronrod rule, and the difference with the embedded 7-point gauss rule
+    estimates its error. While the total error exceeds epsilon, the intervals of largest errors are bisected,
+    so the function is only sampled densely where it is rough.
+    Intervals that cannot be bisected any further at floating point resolution (e.g. around integrable singularities)
+    are kept as they are, and an error estimate that is not finite is reported as inf.
+    All intervals of an iteration are evaluated by a single call of f.
+    As with <integrate>, f may return an array whose last axis runs along the points to integrate many integrands.
+
+    :param f: vectorized function
+    :param a: left endpoint
+    :param b: right endpoint
+    :param epsilon: maximum tolerance
+    :param stop: maximum iterations
+    :param full_output: whether to also return the error estimate and the number of function evaluations
+
+    :return: approximated definite integral with error less than epsilon,
+             followed by the error estimate and the number of evaluations if full_output is set
+    """
+    if a == b:
+        return (0., 0., 0) if full_output else 0.
+    lo, hi, errors, kronrod = np.empty(0), np.empty(0), np.empty(0), None
+    frozen = np.empty(0, dtype=bool)
+    new_lo, new_hi, parents, evaluations = np.array([a], dtype=float), np.array([b], dtype=float), None, 0
+    while True:
+        half, mid = (new_hi - new_lo) / 2, (new_hi + new_lo) / 2
+        y = f((mid[:, None] + half[:, None] * _GK_NODES).ravel())
+        y = y.reshape(y.shape[:-1] + (new_lo.size, 15))
+        k = y @ _GK_WEIGHTS * half
+        e = np.abs(k - y @ _G_WEIGHTS * half)
+        evaluations += y.shape[-1] * new_lo.size
+        scale = np.abs(k)
+        if e.ndim > 1:
+            e = np.max(e.reshape(-1, new_lo.size), axis=0)
+            scale = np.max(scale.reshape(-1, new_lo.size), axis=0)
+        e[~np.isfinite(e)] = np.inf
+        # intervals whose error is down to rounding cannot improve either
+        stuck = e <= 50 * np.finfo(float).eps * scale
+
+        if parents is not None:
+            # halves sampled right at a singularity are dropped, and their parent is kept as it was instead
+            p_lo, p_hi, p_k, p_e = parents
+            lost = np.isinf(e[:p_lo.size]) | np.isinf(e[p_lo.size:])
+            keep = ~np.concatenate([lost, lost])
+            new_lo, new_hi = np.concatenate([new_lo[keep], p_lo[lost]]), np.concatenate([new_hi[keep], p_hi[lost]])
+            k, e = np.concatenate([k[..., keep], p_k[..., lost]], axis=-1), np.concatenate([e[keep], p_e[lost]])
+            stuck = np.concatenate([stuck[keep], lost[lost]])
+
+        kronrod = k if kronrod is None else np.concatenate([kronrod, k], axis=-1)
+        lo, hi, errors = np.concatenate([lo, new_lo]), np.concatenate([hi, new_hi]), np.concatenate([errors, e])
+        frozen = np.concatenate([frozen, stuck])
+
+        stop -= 1
+        # intervals whose error is not finite, or too narrow to be bisected at floating point resolution
+        # (e.g. around integrable singularities), cannot improve and are kept as they are
+        fixed = frozen | np.isinf(errors) | (np.abs(hi - lo) <= 128 * np.spacing(np.maximum(np.abs(lo), np.abs(hi))))
+        finite = np.where(np.isinf(errors), 0, errors)
+        # once the errors of those intervals alone exceed epsilon, the others are only refined to match them
+        excess = np.sum(finite) - max(epsilon, 2 * np.sum(finite[fixed]))
+        candidates = np.flatnonzero(~fixed)
+        if excess <= 0 or stop <= 0 or not candidates.size:
+            break
+
+        # bisect the fewest intervals of largest errors that together exceed the tolerance
+        order = candidates[np.argsort(-errors[candidates])]
+        split = order[:np.searchsorted(np.cumsum(errors[order]), excess) + 1]
+        parents = lo[split], hi[split], kronrod[..., split], errors[split]
+        mid = (lo[split] + hi[split]) / 2
+        new_lo, new_hi = np.concatenate([lo[split], mid]), np.concatenate([mid, hi[split]])
+        keep = np.ones(lo.size, dtype=bool)
+        keep[split] = False
+        kronrod, lo, hi, errors, frozen = kronrod[..., keep], lo[keep], hi[keep], errors[keep], frozen[keep]
+
+    if full_output:
+        return np.sum(kronrod, axis=-1), np.sum(errors), evaluations
+    return np.sum(kronrod, axis=-1)
 
 
 def simpsons(f: Callable[[Any], Any], a: float, b: float, n: int):
@@ -84,5 +466,5 @@ def simpsons(f: Callable[[Any], Any], a: float, b: float, n: int):
     """
     x = np.linspace(a, b, n + 1)
     y = f(x)
-    s = np.sum(y[0:-1:2] + y[2::2] + 4 * y[1::2])
+    s = np.sum(y[..., 0:-1:2] + y[..., 2::2] + 4 * y[..., 1::2], axis=-1)
     return s * (b - a) / (3 * n)
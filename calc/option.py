@@ -1,9 +1,35 @@
 import logging
 
 import numpy as np
-from scipy.stats import norm
 
-from calc.optimize import root
+from calc import kernels
+from calc.optimize import WARM_STOP, get_cache, root, root_vec
+from calc.special import ncdf, npdf
+
+# status codes reported by the batched implied volatility solver
+CONVERGED = 0
+BELOW_LOWER_BOUND = 1
+ABOVE_UPPER_BOUND = 2
+NOT_CONVERGED = 3
+INVALID_INPUT = 4
+
+# volatility bracket of the batched implied volatility solver
+_SIGMA_LOWER = 10e-9
+_SIGMA_UPPER = 10.
+
+# groups of cached intermediates of <Vanilla>, flagged as dirty when they need to be recomputed
+_ROOT = 1  # square root of time to maturity
+_DISCQ = 2  # discount factor of dividend
+_DISCR = 4  # discount factor of risk-free rate
+_PVS = 8  # present value of S
+_PVK = 16  # present value of K
+_D = 32  # d1 and d2
+_N = 64  # probability densities and cumulative probabilities of ds
+_ALL = 127
+
+# premium and greeks returned by <Vanilla.greeks> and <VanillaBatch.greeks>
+GREEKS = ('premium', 'delta', 'vega', 'gamma', 'theta', 'rho', 'charm',
+          'vanna', 'vomma', 'speed', 'zomma', 'color', 'veta', 'ultima')
 
 
 class Vanilla(object):
@@ -13,8 +39,14 @@ class Vanilla(object):
     A put can be specified by setting the indicating boolean value to True.
     The volatility can be provided as <sigma>, which will shadow the argument <price>.
     If <sigma> is not provided, <price> must be provided in its place, where the volatility is implied.
+    Intermediate values are computed lazily: setting a parameter only flags the intermediates depending on it,
+    and they are recomputed when a premium or greek needing them is read.
     """
 
+    __slots__ = ('_S', '_K', '_T', '_r', '_q', '_sigma', '_put', '_dirty',
+                 '_rootT', '_expnqt', '_expnrt', '_pvs', '_pvk', '_d1', '_d2',
+                 '_nd1', '_nd2', '_Nd1', '_Nd2', '_Nnd1', '_Nnd2')
+
     def __init__(self, S: float, K: float, T: float, r: float, sigma: float = None, q: float = 0,
                  put: bool = False, price: float = None):
         """
@@ -35,47 +67,69 @@ class Vanilla(object):
         self._r = r
         self._q = q
         self._put = put
+        self._dirty = _ALL
 
         if sigma is not None:  # use sigma to compute premium
             self._sigma = sigma
-            self.__refresh_value_cache__()
         elif price is not None:
             self.premium = price  # use premium to compute implied volatility
         else:
             raise ValueError("one of implied volatility or traded price must be present")
 
-    def __refresh_value_cache__(self):
+    def __refresh_value_cache__(self, flags: int = _ALL):
         """
-        recompute frequently accessed cache values
+        recompute the dirty ones among the given groups of cached values, and the dirty groups they depend on
 
+        :param flags: groups of cached values about to be accessed
         :return:
         """
+        flags &= self._dirty
+        if not flags:
+            return
+        if flags & _N:
+            flags |= self._dirty & _D
+        if flags & _D:
+            flags |= self._dirty & _ROOT
+        if flags & _PVS:
+            flags |= self._dirty & _DISCQ
+        if flags & _PVK:
+            flags |= self._dirty & _DISCR
+
         # black scholes coefficients
-        self._rootT = np.sqrt(self._T)
-        self._d1 = (np.log(self.S / self.K) + (self._r - self._q + 0.5 * self._sigma ** 2) * self._T) \
-                   / (self._sigma * self._rootT)
-        self._d2 = self._d1 - self._sigma * self._rootT
+        if flags & _ROOT:
+            self._rootT = np.sqrt(self._T)
+        if flags & _D:
+            self._d1 = (np.log(self._S / self._K) + (self._r - self._q + 0.5 * self._sigma ** 2) * self._T) \
+                       / (self._sigma * self._rootT)
+            self._d2 = self._d1 - self._sigma * self._rootT
 
         # discount factor of dividend and risk-free rate respectively
-        self._expnqt = np.exp(-self._q * self._T)
-        self._expnrt = np.exp(-self._r * self._T)
+        if flags & _DISCQ:
+            self._expnqt = np.exp(-self._q * self._T)
+        if flags & _DISCR:
+            self._expnrt = np.exp(-self._r * self._T)
 
         # present value of S & K, discounted at dividend and risk-free rate respectively
-        self._pvs = self._S * self._expnqt
-        self._pvk = self._K * self._expnrt
+        if flags & _PVS:
+            self._pvs = self._S * self._expnqt
+        if flags & _PVK:
+            self._pvk = self._K * self._expnrt
 
         # the following three sections are related to the standard normal distribution
-        # probability density of ds
-        self._nd1 = norm.pdf(self._d1)
-        self._nd2 = norm.pdf(self._d2)
+        if flags & _N:
+            # probability density of ds
+            self._nd1 = npdf(self._d1)
+            self._nd2 = npdf(self._d2)
 
-        # cumulative density of ds
-        self._Nd1 = norm.cdf(self._d1)
-        self._Nd2 = norm.cdf(self._d2)
+            # cumulative density of ds
+            self._Nd1 = ncdf(self._d1)
+            self._Nd2 = ncdf(self._d2)
 
-        # cumulative density of negative ds
-        self._Nnd1 = 1 - self._Nd1
-        self._Nnd2 = 1 - self._Nd2
+            # cumulative density of negative ds
+            self._Nnd1 = 1 - self._Nd1
+            self._Nnd2 = 1 - self._Nd2
+
+        self._dirty &= ~flags
 
     @property
     def S(self):
@@ -86,7 +140,7 @@ class Vanilla(object):
         if self._S == value:
             return
         self._S = value
-        self.__refresh_value_cache__()
+        self._dirty |= _PVS | _D | _N
 
     @property
     def K(self):
@@ -97,7 +151,7 @@ class Vanilla(object):
         if self._K == value:
             return
         self._K = value
-        self.__refresh_value_cache__()
+        self._dirty |= _PVK | _D | _N
 
     @property
     def T(self):
@@ -108,7 +162,7 @@ class Vanilla(object):
         if self._T == value:
             return
         self._T = value
-        self.__refresh_value_cache__()
+        self._dirty |= _ALL
 
     @property
     def r(self):
@@ -119,7 +173,7 @@ class Vanilla(object):
         if self._r == value:
             return
         self._r = value
-        self.__refresh_value_cache__()
+        self._dirty |= _DISCR | _PVK | _D | _N
 
     @property
     def sigma(self):
@@ -134,7 +188,7 @@ class Vanilla(object):
         if self._sigma == value:
             return
         self._sigma = value
-        self.__refresh_value_cache__()
+        self._dirty |= _D | _N
 
     @property
     def q(self):
@@ -145,7 +199,7 @@ class Vanilla(object):
         if self._q == value:
             return
         self._q = value
-        self.__refresh_value_cache__()
+        self._dirty |= _DISCQ | _PVS | _D | _N
 
     @property
     def put(self):
@@ -157,6 +211,7 @@ class Vanilla(object):
 
     @property
     def premium(self):
+        self.__refresh_value_cache__(_PVS | _PVK | _N)
         if not self._put:
             return self._pvs * self._Nd1 \
                    - self._pvk * self._Nd2
@@ -168,17 +223,40 @@ class Vanilla(object):
     def premium(self, value):
         def f(x):
             self._sigma = x
-            self.__refresh_value_cache__()
+            self._dirty |= _D | _N
             return self.premium - value
 
         def df(x):
             return self.vega
 
+        # newton's method starts from the previous volatility of the option, or a cached volatility of an option
+        # with the same terms, and the secant method starts from 0.2 if there is neither
+        # or if newton's method does not converge within a few iterations to a volatility within the bracket
+        cache = get_cache()
+        key = cache.key('implied', (self._S, self._K, self._T, self._r, self._q, self._put), value) \
+            if cache is not None else None
+        guess = getattr(self, '_sigma', None)
+        if guess is None or not _SIGMA_LOWER < guess < _SIGMA_UPPER:
+            guess = cache.get(key) if cache is not None else None
+        sigma = None
+        if guess is not None:
+            try:
+                sigma = root(f, guess, df, epsilon=10e-8, delta=10e-8, stop=WARM_STOP, tag='implied')
+            except RuntimeError:
+                pass
+            if sigma is not None and not _SIGMA_LOWER < sigma < _SIGMA_UPPER:
+                sigma = None
         try:
-            # compute implied volatility with initial guess = 0.25
-            self.sigma = root(f, 0.2, epsilon=10e-8, delta=10e-8, progress=True)
+            if sigma is None:
+                sigma = root(f, 0.2, epsilon=10e-8, delta=10e-8, tag='implied')
+            self.sigma = sigma
         except RuntimeError:
+            # the option is left without a volatility rather than at the last approximation
             logging.error("invalid option price ")
+            self.sigma = np.nan
+            return
+        if cache is not None:
+            cache.put(key, self._sigma)
 
     @property
     def delta(self):
@@ -187,6 +265,7 @@ class Vanilla(object):
 
         :return:
         """
+        self.__refresh_value_cache__(_DISCQ | _N)
         if not self._put:
             return self._expnqt * self._Nd1
         else:
@@ -199,6 +278,7 @@ class Vanilla(object):
 
         :return:
         """
+        self.__refresh_value_cache__(_PVS | _ROOT | _N)
         return self._pvs * self._rootT * self._nd1
 
     @property
@@ -208,6 +288,7 @@ class Vanilla(object):
 
         :return:
         """
+        self.__refresh_value_cache__(_DISCQ | _ROOT | _N)
         return self._expnqt / self._S / self._sigma / self._rootT * self._nd1
 
     @property
@@ -217,6 +298,7 @@ class Vanilla(object):
 
         :return:
         """
+        self.__refresh_value_cache__(_PVS | _PVK | _ROOT | _N)
         if not self._put:
             return - self._sigma * self._pvs / 2 / self._rootT * self._nd1 \
                    + self._q * self._pvs * self._Nd1 \
@@ -233,6 +315,7 @@ class Vanilla(object):
 
         :return:
         """
+        self.__refresh_value_cache__(_PVK | _N)
         if not self._put:
             return self._T * self._pvk * self._Nd2
         else:
@@ -240,6 +323,7 @@ class Vanilla(object):
 
     @property
     def charm(self):
+        self.__refresh_value_cache__(_DISCQ | _ROOT | _N)
         tmp = - self._expnqt * self._nd1 * (
                 2 * (self._r - self._q) * self._T - self._d2 * self._sigma * self._rootT) / (
                       2 * self._T * self._sigma * self._rootT)
@@ -248,6 +332,86 @@ class Vanilla(object):
         else:
             return tmp - self._q * self._expnqt * self._Nnd1
 
+    @property
+    def vanna(self):
+        """
+        second order derivative of option value with respect to underlying spot price and implied volatility
+
+        :return:
+        """
+        self.__refresh_value_cache__(_DISCQ | _N)
+        return -self._expnqt * self._nd1 * self._d2 / self._sigma
+
+    @property
+    def vomma(self):
+        """
+        second order derivative of option value twice with respect to implied volatility
+
+        :return:
+        """
+        return self.vega * self._d1 * self._d2 / self._sigma
+
+    @property
+    def speed(self):
+        """
+        third order derivative of option value thrice with respect to underlying spot price
+
+        :return:
+        """
+        return -self.gamma / self._S * (self._d1 / (self._sigma * self._rootT) + 1)
+
+    @property
+    def zomma(self):
+        """
+        derivative of gamma with respect to implied volatility
+
+        :return:
+        """
+        return self.gamma * (self._d1 * self._d2 - 1) / self._sigma
+
+    @property
+    def color(self):
+        """
+        derivative of gamma with respect to the passage of time, with the same sign convention as theta and charm
+
+        :return:
+        """
+        self.__refresh_value_cache__(_DISCQ | _ROOT | _N)
+        srootT = self._sigma * self._rootT
+        return self._expnqt * self._nd1 / (2 * self._S * self._T * srootT) * (
+                2 * self._q * self._T + 1
+                + (2 * (self._r - self._q) * self._T - self._d2 * srootT) / srootT * self._d1)
+
+    @property
+    def veta(self):
+        """
+        derivative of vega with respect to the passage of time, with the same sign convention as theta and charm
+
+        :return:
+        """
+        return self.vega * (self._q + (self._r - self._q) * self._d1 / (self._sigma * self._rootT)
+                            - (1 + self._d1 * self._d2) / (2 * self._T))
+
+    @property
+    def ultima(self):
+        """
+        third order derivative of option value thrice with respect to implied volatility
+
+        :return:
+        """
+        self.__refresh_value_cache__(_PVS | _ROOT | _N)
+        d1d2 = self._d1 * self._d2
+        return -self.vega / self._sigma ** 2 * (d1d2 * (1 - d1d2) + self._d1 ** 2 + self._d2 ** 2)
+
+    def greeks(self):
+        """
+        premium and every greek of the option, sharing one computation of the cached intermediates
+
+        :return: dictionary keyed by the names in GREEKS
+        """
+        self.__refresh_value_cache__()
+        return {name: getattr(self, name) for name in GREEKS}
+
     @property
     def dVdK(self):
         """
@@ -255,5 +419,429 @@ class Vanilla(object):
 
         :return:
         """
+        self.__refresh_value_cache__(_DISCR | _PVS | _PVK | _ROOT | _N)
         return self._expnrt * self._Nnd2 + self._pvk * self._nd2 / self.K / self.sigma / self._rootT \
                - self._pvs * self._nd1 / self.K / self.sigma / self._rootT
+
+
+class VanillaBatch(object):
+    """
+    Represents a chain of plain vanilla European options evaluated together.
+    Every parameter may be a scalar or an array, and all of them are broadcast against each other,
+    so that a whole chain (e.g. every strike of an expiry, or every contract of a book)
+    is priced in a single vectorized pass instead of one <Vanilla> object per contract.
+    <put> may be an array of booleans to mix calls and puts within one batch.
+    As with <Vanilla>, either <sigma> or <price> must be provided, and <sigma> shadows <price>.
+    Implied volatilities of contracts that could not be solved are nan and flagged in <status>.
+    Premiums and greeks are returned as arrays of the broadcast shape and agree with <Vanilla>.
+    """
+
+    def __init__(self, S, K, T, r, sigma=None, q=0, put=False, price=None):
+        """
+        construct a batch of plain vanilla European options
+
+        :param S: underlying spot prices
+        :param K: strike prices
+        :param T: times to maturity
+        :param r: continuously compounded risk-free interest rates
+        :param sigma: (implied) black-scholes volatilities
+        :param q: continuously distributed dividend rates
+        :param put: whether each option is a put
+        :param price: traded prices
+        """
+        if sigma is None:
+            if price is None:
+                raise ValueError("one of implied volatility or traded price must be present")
+            sigma, self._status = implied_volatility(price, S, K, T, r, q=q, put=put)
+        else:
+            self._status = None
+
+        self._S, self._K, self._T, self._r, self._sigma, self._q, self._put = np.broadcast_arrays(
+            np.asarray(S, dtype=float), np.asarray(K, dtype=float), np.asarray(T, dtype=float),
+            np.asarray(r, dtype=float), np.asarray(sigma, dtype=float), np.asarray(q, dtype=float),
+            np.asarray(put, dtype=bool))
+        self.__refresh_value_cache__()
+
+    def __refresh_value_cache__(self):
+        """
+        recompute the premium and the first order greeks of every option,
+        by the compiled kernel of <calc.kernels> when numba is installed, or from the intermediates otherwise
+
+        :return:
+        """
+        # +1 for calls and -1 for puts, so that both are evaluated by the same expressions
+        self._w = np.where(self._put, -1., 1.)
+        self._d1 = None
+        if kernels.BACKEND == kernels.NUMBA:
+            # rows as in kernels.VANILLA, and the intermediates are only computed for higher order greeks
+            self._first = kernels.vanilla(self._S, self._K, self._T, self._r, self._sigma, self._q, self._put)
+        else:
+            self._first = None
+            self.__intermediates__()
+
+    def __intermediates__(self):
+        """
+        compute the intermediates shared by the premium and the greeks of every option, unless already computed
+
+        :return:
+        """
+        if self._d1 is not None:
+            return
+
+        # black scholes coefficients
+        self._rootT = np.sqrt(self._T)
+        self._srootT = self._sigma * self._rootT
+        self._d1 = (np.log(self._S / self._K) + (self._r - self._q + 0.5 * self._sigma ** 2) * self._T) \
+                   / self._srootT
+        self._d2 = self._d1 - self._srootT
+
+        # discount factor of dividend and risk-free rate respectively
+        self._expnqt = np.exp(-self._q * self._T)
+        self._expnrt = np.exp(-self._r * self._T)
+
+        # present value of S & K, discounted at dividend and risk-free rate respectively
+        self._pvs = self._S * self._expnqt
+        self._pvk = self._K * self._expnrt
+
+        # probability density of ds
+        self._nd1 = npdf(self._d1)
+        self._nd2 = npdf(self._d2)
+
+        # cumulative density of ds for calls and of negative ds for puts
+        self._Nwd1 = ncdf(self._w * self._d1)
+        self._Nwd2 = ncdf(self._w * self._d2)
+
+    @property
+    def shape(self):
+        return self._S.shape
+
+    @property
+    def S(self):
+        return self._S
+
+    @property
+    def K(self):
+        return self._K
+
+    @property
+    def T(self):
+        return self._T
+
+    @property
+    def r(self):
+        return self._r
+
+    @property
+    def sigma(self):
+        return self._sigma
+
+    @property
+    def implied(self):
+        return self._sigma
+
+    @property
+    def q(self):
+        return self._q
+
+    @property
+    def put(self):
+        return self._put
+
+    @property
+    def status(self):
+        """
+        status codes of the implied volatility solve, or None if volatilities were provided
+
+        :return:
+        """
+        return self._status
+
+    @property
+    def premium(self):
+        if self._first is not None:
+            return self._first[0]
+        return self._w * (self._pvs * self._Nwd1 - self._pvk * self._Nwd2)
+
+    @property
+    def delta(self):
+        """
+        first order derivative of option values with respect to underlying spot prices
+
+        :return:
+        """
+        if self._first is not None:
+            return self._first[1]
+        return self._w * self._expnqt * self._Nwd1
+
+    @property
+    def vega(self):
+        """
+        first order derivative of option values with respect to implied volatilities
+
+        :return:
+        """
+        if self._first is not None:
+            return self._first[2]
+        return self._pvs * self._rootT * self._nd1
+
+    @property
+    def gamma(self):
+        """
+        second order derivative of option values twice with respect to underlying spot prices
+
+        :return:
+        """
+        if self._first is not None:
+            return self._first[3]
+        return self._expnqt / self._S / self._srootT * self._nd1
+
+    @property
+    def theta(self):
+        """
+        first order derivative of option values with respect to time to maturity
+
+        :return:
+        """
+        if self._first is not None:
+            return self._first[4]
+        return - self._sigma * self._pvs / 2 / self._rootT * self._nd1 \
+               + self._w * (self._q * self._pvs * self._Nwd1 - self._r * self._pvk * self._Nwd2)
+
+    @property
+    def rho(self):
+        """
+        first order derivative of option values with respect to risk-free interest rates
+
+        :return:
+        """
+        if self._first is not None:
+            return self._first[5]
+        return self._w * self._T * self._pvk * self._Nwd2
+
+    @property
+    def charm(self):
+        self.__intermediates__()
+        tmp = - self._expnqt * self._nd1 * (
+                2 * (self._r - self._q) * self._T - self._d2 * self._srootT) / (2 * self._T * self._srootT)
+        return tmp + self._w * self._q * self._expnqt * self._Nwd1
+
+    @property
+    def vanna(self):
+        """
+        second order derivative of option values with respect to underlying spot prices and implied volatilities
+
+        :return:
+        """
+        self.__intermediates__()
+        return -self._expnqt * self._nd1 * self._d2 / self._sigma
+
+    @property
+    def vomma(self):
+        """
+        second order derivative of option values twice with respect to implied volatilities
+
+        :return:
+        """
+        self.__intermediates__()
+        return self.vega * self._d1 * self._d2 / self._sigma
+
+    @property
+    def speed(self):
+        """
+        third order derivative of option values thrice with respect to underlying spot prices
+
+        :return:
+        """
+        self.__intermediates__()
+        return -self.gamma / self._S * (self._d1 / self._srootT + 1)
+
+    @property
+    def zomma(self):
+        """
+        derivative of gammas with respect to implied volatilities
+
+        :return:
+        """
+        self.__intermediates__()
+        return self.gamma * (self._d1 * self._d2 - 1) / self._sigma
+
+    @property
+    def color(self):
+        """
+        derivative of gammas with respect to the passage of time, with the same sign convention as theta and charm
+
+        :return:
+        """
+        self.__intermediates__()
+        return self._expnqt * self._nd1 / (2 * self._S * self._T * self._srootT) * (
+                2 * self._q * self._T + 1
+                + (2 * (self._r - self._q) * self._T - self._d2 * self._srootT) / self._srootT * self._d1)
+
+    @property
+    def veta(self):
+        """
+        derivative of vegas with respect to the passage of time, with the same sign convention as theta and charm
+
+        :return:
+        """
+        self.__intermediates__()
+        return self.vega * (self._q + (self._r - self._q) * self._d1 / self._srootT
+                            - (1 + self._d1 * self._d2) / (2 * self._T))
+
+    @property
+    def ultima(self):
+        """
+        third order derivative of option values thrice with respect to implied volatilities
+
+        :return:
+        """
+        self.__intermediates__()
+        d1d2 = self._d1 * self._d2
+        return -self.vega / self._sigma ** 2 * (d1d2 * (1 - d1d2) + self._d1 ** 2 + self._d2 ** 2)
+
+    def greeks(self):
+        """
+        premiums and every greek of the options
+
+        :return: dictionary of arrays keyed by the names in GREEKS
+        """
+        return {name: getattr(self, name) for name in GREEKS}
+
+    @property
+    def dVdK(self):
+        """
+        not an actual greek, evaluated by the same expression as <Vanilla.dVdK>
+
+        :return:
+        """
+        self.__intermediates__()
+        Nnd2 = np.where(self._put, self._Nwd2, 1 - self._Nwd2)
+        return self._expnrt * Nnd2 + (self._pvk * self._nd2 - self._pvs * self._nd1) / self._K / self._srootT
+
+
+def implied_volatility(price, S, K, T, r, q=0, put=False, epsilon: float = 10e-9, delta: float = 10e-9,
+                       stop: int = 100):
+    """
+    Compute the black-scholes implied volatilities of a whole chain of plain vanilla European options at once.
+    All arguments are broadcast against each other.
+    Puts are mapped to calls through put-call parity, and every contract is solved simultaneously by <root_vec>,
+    i.e. newton's method using the analytic vega, safeguarded by a bisection bracket on volatility.
+    The initial guess is the Corrado-Miller approximation.
+    Contracts stop iterating as soon as they converge.
+    Nothing is raised or printed for contracts that cannot be solved; they are reported in the status array
+    (CONVERGED, BELOW_LOWER_BOUND, ABOVE_UPPER_BOUND, NOT_CONVERGED or INVALID_INPUT) and their volatilities are nan.
+
+    :param price: traded prices
+    :param S: underlying spot prices
+    :param K: strike prices
+    :param T: times to maturity
+    :param r: continuously compounded risk-free interest rates
+    :param q: continuously distributed dividend rates
+    :param put: whether each option is a put
+    :param epsilon: largest permissible pricing error when solution is found
+    :param delta: largest permissible distance between two consecutive approximations when solution is found
+    :param stop: maximum iterations
+    :return: implied volatilities and status codes
+    """
+    price, S, K, T, r, q, put = np.broadcast_arrays(
+        np.asarray(price, dtype=float), np.asarray(S, dtype=float), np.asarray(K, dtype=float),
+        np.asarray(T, dtype=float), np.asarray(r, dtype=float), np.asarray(q, dtype=float),
+        np.asarray(put, dtype=bool))
+    shape = price.shape
+    price, S, K, T, r, q, put = (x.ravel() for x in (price, S, K, T, r, q, put))
+
+    sigma = np.full(price.shape, np.nan)
+    status = np.full(price.shape, NOT_CONVERGED, dtype=np.int8)
+
+    with np.errstate(all="ignore"):
+        pvs = S * np.exp(-q * T)
+        pvk = K * np.exp(-r * T)
+        # equivalent call prices by put-call parity
+        call = np.where(put, price + pvs - pvk, price)
+
+        invalid = ~(np.isfinite(call) & (S > 0) & (K > 0) & (T > 0))
+        below = ~invalid & (call <= np.maximum(pvs - pvk, 0))
+        above = ~invalid & ~below & (call >= pvs)
+    status[invalid] = INVALID_INPUT
+    status[below] = BELOW_LOWER_BOUND
+    status[above] = ABOVE_UPPER_BOUND
+
+    idx = np.flatnonzero(status == NOT_CONVERGED)
+    c, s, k, rootT = call[idx], pvs[idx], pvk[idx], np.sqrt(T[idx])
+    lns = np.log(s / k)
+
+    # corrado-miller approximation of sigma * sqrt(T)
+    m = c - (s - k) / 2
+    x0 = np.sqrt(2 * np.pi) / (s + k) * (m + np.sqrt(np.maximum(m * m - (s - k) ** 2 / np.pi, 0)))
+    x0 = np.where(np.isfinite(x0) & (x0 > 0), x0, np.sqrt(2 * np.abs(lns)) + 0.1) / rootT
+    x0 = np.clip(x0, _SIGMA_LOWER * 2, _SIGMA_UPPER / 2)
+
+    def f(x, i):
+        srootT = x * rootT[i]
+        d1 = lns[i] / srootT + srootT / 2
+        return s[i] * ncdf(d1) - k[i] * ncdf(d1 - srootT) - c[i]
+
+    def df(x, i):
+        srootT = x * rootT[i]
+        return s[i] * rootT[i] * npdf(lns[i] / srootT + srootT / 2)
+
+    with np.errstate(all="ignore"):
+        x, converged, _, _ = root_vec(f, x0, df, epsilon=epsilon, delta=delta, stop=stop,
+                                      lower=_SIGMA_LOWER, upper=_SIGMA_UPPER, tag='implied')
+    sigma[idx[converged]] = x[converged]
+    status[idx[converged]] = CONVERGED
+
+    return sigma.reshape(shape), status.reshape(shape)
+
+
+def implied_forward(K, C, P, T: float, S: float = None, threshold: float = 3.5, stop: int = 10):
+    """
+    Back out the forward price and the implied rates of a chain of paired call and put prices of a single expiry
+    from put-call parity, C - P = exp(-r * T) * (F - K), by a robust regression of C - P on K.
+    The initial line goes through the median slope of neighbouring strikes,
+    then quotes whose residuals exceed <threshold> robust standard deviations (scaled median absolute deviations)
+    are rejected and the line is refitted by least squares on the remaining quotes, until the rejected quotes settle.
+    The implied risk-free rate follows from the discount factor exp(-r * T) and the dividend rate from the forward,
+    F = S * exp((r - q) * T), which makes them suitable seeds of <implied_volatility>.
+
+    :param K: strikes
+    :param C: call prices
+    :param P: put prices
+    :param T: time to maturity
+    :param S: underlying spot price, or None to use the implied forward as the spot (so that q = r)
+    :param threshold: robust standard deviations beyond which quotes are rejected as outliers
+    :param stop: maximum iterations
+    :return: implied forward, risk-free rate, dividend rate, and the mask of quotes used by the final fit
+    """
+    K, y = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(C, dtype=float) - np.asarray(P, dtype=float))
+    inliers = np.isfinite(K) & np.isfinite(y)
+    if np.count_nonzero(inliers) < 2:
+        raise ValueError("at least two paired quotes are needed to imply the forward")
+
+    order = np.argsort(K[inliers])
+    k, v = K[inliers][order], y[inliers][order]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = np.diff(v) / np.diff(k)
+    slope = np.median(slopes[np.isfinite(slopes)])
+    intercept = np.median(v - slope * k)
+    # quotes on the line are kept even when most residuals vanish, missing quotes aside
+    floor = 10e-12 * np.abs(v).max()
+
+    while stop > 0:
+        residuals = np.abs(y - intercept - slope * K)
+        scale = 1.4826 * np.median(residuals[inliers])
+        new = np.isfinite(residuals) & (residuals <= threshold * scale + floor)
+        if np.count_nonzero(new) < 2:
+            break
+        slope, intercept = np.polyfit(K[new], y[new], 1)
+        if np.array_equal(new, inliers):
+            break
+        inliers = new
+        stop -= 1
+
+    if not slope < 0:
+        raise ValueError("put-call parity implies a non-positive discount factor")
+    F = -intercept / slope
+    r = -np.log(-slope) / T
+    q = r if S is None else r - np.log(F / S) / T
+    return F, r, q, inliers
@@ -0,0 +1,222 @@
+from typing import Callable, Union
+
+import numpy as np
+from scipy.linalg.lapack import dgttrf, dgttrs
+
+# boundary conditions of the spot grid, away from barriers
+LINEAR = "linear"  # the black-scholes equation with vanishing gamma
+DIRICHLET = "dirichlet"  # the asymptotic option values deep in and out of the money
+
+
+class CrankNicolson(object):
+    """
+    Represents a plain vanilla option, American or European and optionally with knock-out barriers,
+    valued by solving the black-scholes equation on a grid of spot prices with the crank-nicolson scheme.
+    The volatility may be a constant or a local volatility function of spot price and (calendar) time.
+    The spot grid may be concentrated around the strike by a sinh transform of an evenly spaced grid.
+    Each time step is one tridiagonal (banded) solve costing O(nodes), with the matrix factorized once
+    when the volatility does not depend on time, and a few fully implicit (rannacher) steps damp the
+    oscillations caused by the kink of the payoff.
+    Option values, deltas and gammas are returned for every node of the grid, so one solve prices a whole spot ladder.
+    """
+
+    def __init__(self, S: float, K: float, T: float, r: float, sigma: Union[float, Callable], q: float = 0,
+                 put: bool = False, american: bool = False, lower: float = None, upper: float = None,
+                 nodes: int = 400, steps: int = 200, smax: float = None, concentration: float = 0.1,
+                 boundary: str = LINEAR, rannacher: int = 2):
+        """
+        construct and solve the finite difference grid of an option
+
+        :param S: underlying spot price
+        :param K: strike price
+        :param T: time to maturity
+        :param r: continuously compounded risk-free interest rate
+        :param sigma: black-scholes volatility, or local volatility function sigma(spots, t) of time t from now
+        :param q: continuously distributed dividend rate
+        :param put: whether the option is a put
+        :param american: whether the option may be exercised early
+        :param lower: knock-out barrier below the spot price, or None
+        :param upper: knock-out barrier above the spot price, or None
+        :param nodes: number of spot nodes
+        :param steps: number of time steps
+        :param smax: largest spot of the grid without upper barrier, defaults to 4 * max(S, K)
+        :param concentration: width of the region of concentrated nodes around the strike, relative to the strike,
+                              or None for evenly spaced nodes
+        :param boundary: boundary condition away from barriers, LINEAR or DIRICHLET
+        :param rannacher: number of fully implicit steps at the start
+        """
+        if boundary not in (LINEAR, DIRICHLET):
+            raise ValueError("unknown boundary condition " + str(boundary))
+        self._S = S
+        self._K = K
+
+        smin = 0. if lower is None else lower
+        smax = upper if upper is not None else (4 * max(S, K) if smax is None else smax)
+        if not smin <= S <= smax:
+            raise ValueError("spot price must lie within the barriers")
+        if concentration is None:
+            grid = np.linspace(smin, smax, nodes)
+        else:
+            c = concentration * K
+            grid = K + c * np.sinh(np.linspace(np.arcsinh((smin - K) / c), np.arcsinh((smax - K) / c), nodes))
+            grid[0], grid[-1] = smin, smax
+        self._grid = grid
+
+        # first and second derivative stencils on the uneven grid
+        hm, hp = np.diff(grid)[:-1], np.diff(grid)[1:]
+        self._d1 = (-hp / (hm * (hm + hp)), (hp - hm) / (hm * hp), hm / (hp * (hm + hp)))
+        self._d2 = (2 / (hm * (hm + hp)), -2 / (hm * hp), 2 / (hp * (hm + hp)))
+
+        w = -1. if put else 1.
+        payoff = np.maximum(w * (grid - K), 0)
+        # barriers knock the option out, and other boundaries follow the boundary condition
+        fixed_lo = lower is not None or boundary == DIRICHLET
+        fixed_hi = upper is not None or boundary == DIRICHLET
+
+        def edges(tau):
+            if lower is not None:
+                lo = 0.
+            else:
+                lo = max(-w * (K * np.exp(-r * tau) - smin * np.exp(-q * tau)), 0)
+                if american:
+                    lo = max(lo, payoff[0])
+            if upper is not None:
+                hi = 0.
+            else:
+                hi = max(w * (smax * np.exp(-q * tau) - K * np.exp(-r * tau)), 0)
+                if american:
+                    hi = max(hi, payoff[-1])
+            return lo, hi
+
+        dt = T / steps
+        v = payoff.copy()
+        if lower is not None:
+            v[0] = 0
+        if upper is not None:
+            v[-1] = 0
+        rhs = np.empty(nodes)
+        factors = {}
+        for k in range(steps):
+            tau = (k + 1) * dt
+            theta = 1. if k < rannacher else 0.5
+            lo, mid, up = self.__operator__(sigma, r, q, T - tau + dt / 2, fixed_lo, fixed_hi)
+
+            # explicit part
+            np.multiply(mid, v, out=rhs)
+            rhs[1:] += lo * v[:-1]
+            rhs[:-1] += up * v[1:]
+            rhs *= (1 - theta) * dt
+            rhs += v
+
+            # the implicit matrix only changes with theta, unless the volatility depends on time
+            if callable(sigma) or theta not in factors:
+                factors[theta] = dgttrf(-theta * dt * lo, 1 - theta * dt * mid, -theta * dt * up)
+            dl, d, du, du2, ipiv, _ = factors[theta]
+            if fixed_lo or fixed_hi:
+                a, b = edges(tau)
+                if fixed_lo:
+                    rhs[0] = a
+                if fixed_hi:
+                    rhs[-1] = b
+            v, _ = dgttrs(dl, d, du, du2, ipiv, rhs)
+            if american:
+                np.maximum(v, payoff, out=v)
+                if lower is not None:
+                    v[0] = 0
+                if upper is not None:
+                    v[-1] = 0
+
+        self._values = v
+        self._deltas = np.empty(nodes)
+        self._gammas = np.empty(nodes)
+        self._deltas[1:-1] = self._d1[0] * v[:-2] + self._d1[1] * v[1:-1] + self._d1[2] * v[2:]
+        self._gammas[1:-1] = self._d2[0] * v[:-2] + self._d2[1] * v[1:-1] + self._d2[2] * v[2:]
+        self._deltas[0] = (v[1] - v[0]) / (grid[1] - grid[0])
+        self._deltas[-1] = (v[-1] - v[-2]) / (grid[-1] - grid[-2])
+        self._gammas[0], self._gammas[-1] = self._gammas[1], self._gammas[-2]
+
+    def __operator__(self, sigma, r: float, q: float, t: float, fixed_lo: bool, fixed_hi: bool):
+        """
+        tridiagonal discretization of the black-scholes operator
+        0.5 * sigma ** 2 * S ** 2 * V'' + (r - q) * S * V' - r * V on the spot grid
+
+        :return: sub-diagonal, diagonal and super-diagonal
+        """
+        grid = self._grid
+        sig = sigma(grid, t) if callable(sigma) else sigma
+        a = 0.5 * np.broadcast_to(sig, grid.shape) ** 2 * grid * grid
+        b = (r - q) * grid
+        lo, mid, up = np.empty(len(grid) - 1), np.empty(len(grid)), np.empty(len(grid) - 1)
+        lo[:-1] = a[1:-1] * self._d2[0] + b[1:-1] * self._d1[0]
+        mid[1:-1] = a[1:-1] * self._d2[1] + b[1:-1] * self._d1[1] - r
+        up[1:] = a[1:-1] * self._d2[2] + b[1:-1] * self._d1[2]
+
+        # boundaries either hold fixed values, or follow the equation with vanishing gamma and one-sided delta
+        h0, h1 = grid[1] - grid[0], grid[-1] - grid[-2]
+        if fixed_lo:
+            mid[0], up[0] = 0, 0
+        else:
+            mid[0], up[0] = -b[0] / h0 - r, b[0] / h0
+        if fixed_hi:
+            mid[-1], lo[-1] = 0, 0
+        else:
+            mid[-1], lo[-1] = b[-1] / h1 - r, -b[-1] / h1
+        return lo, mid, up
+
+    @property
+    def spots(self):
+        """
+        spot prices of the grid nodes
+
+        :return:
+        """
+        return self._grid
+
+    @property
+    def values(self):
+        """
+        option values at every grid node
+
+        :return:
+        """
+        return self._values
+
+    @property
+    def deltas(self):
+        """
+        deltas at every grid node
+
+        :return:
+        """
+        return self._deltas
+
+    @property
+    def gammas(self):
+        """
+        gammas at every grid node
+
+        :return:
+        """
+        return self._gammas
+
+    @property
+    def premium(self):
+        return np.interp(self._S, self._grid, self._values)
+
+    @property
+    def delta(self):
+        """
+        first order derivative of option value with respect to underlying spot price
+
+        :return:
+        """
+        return np.interp(self._S, self._grid, self._deltas)
+
+    @property
+    def gamma(self):
+        """
+        second order derivative of option value twice with respect to underlying spot price
+
+        :return:
+        """
+        return np.interp(self._S, self._grid, self._gammas)
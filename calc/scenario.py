@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Sequence
+
+import numpy as np
+
+from calc.bond import BondBook
+from calc.option import VanillaBatch, _SIGMA_LOWER
+
+# approximate memory used per (scenario, option) pair while repricing, i.e. the float intermediates of <VanillaBatch>
+_CELL_BYTES = 8 * 16
+
+
+def _reprice(args):
+    """
+    profit and loss of a block of options under a block of scenarios
+
+    :param args: S, K, T, r, sigma, q, put, quantities and base premiums of the options,
+                 and relative spot, absolute volatility and absolute rate shocks of the scenarios
+    :return: profit and loss of the block of options in each scenario
+    """
+    S, K, T, r, sigma, q, put, quantity, base, ds, dv, dr = args
+    shocked = VanillaBatch(S * (1 + ds[:, None]), K, T, r + dr[:, None],
+                           np.maximum(sigma + dv[:, None], _SIGMA_LOWER), q, put)
+    return (shocked.premium - base) @ quantity
+
+
+def pnl(options: VanillaBatch = None, bonds: BondBook = None, spot: Sequence[float] = (0.,),
+        vol: Sequence[float] = (0.,), rate: Sequence[float] = (0.,), option_quantity=1, bond_quantity=1,
+        budget: int = 2 ** 28, processes: int = None):
+    """
+    Compute the profit and loss cube of a portfolio of options and bonds over a grid of shocks.
+    Every option is repriced under every combination of a relative spot shock, an absolute volatility shock and
+    an absolute rate shock, which also shifts the yields of the bonds.
+    The grid of scenarios and the options are cut into blocks that each fit within the memory budget,
+    every block is repriced in one broadcast computation, and blocks may be spread over a pool of processes.
+
+    :param options: one dimensional batch of European options
+    :param bonds: bond book
+    :param spot: relative spot shocks, e.g. -0.1 for a 10% fall of every underlying
+    :param vol: absolute volatility shocks
+    :param rate: absolute shocks of interest rates and bond yields
+    :param option_quantity: number of contracts of each option
+    :param bond_quantity: number of bonds of each bond of the book
+    :param budget: approximate memory budget of each block in bytes
+    :param processes: number of worker processes, or None to reprice in the calling process
+    :return: profit and loss of the portfolio, of shape (spot shocks, volatility shocks, rate shocks)
+    """
+    spot, vol, rate = (np.atleast_1d(np.asarray(x, dtype=float)) for x in (spot, vol, rate))
+    shape = (len(spot), len(vol), len(rate))
+    cube = np.zeros(shape)
+
+    if bonds is not None:
+        quantity = np.broadcast_to(np.asarray(bond_quantity, dtype=float), bonds.T.shape)
+        step = max(1, budget // (8 * len(bonds.ts)))
+        for i in range(0, len(rate), step):
+            shift = rate[i:i + step, None]
+            cube[:, :, i:i + step] += (bonds.price(shift) - bonds.B) @ quantity
+
+    if options is not None:
+        if options.premium.ndim != 1:
+            raise ValueError("options must be a one dimensional batch")
+        terms = (options.S, options.K, options.T, options.r, options.sigma, options.q, options.put)
+        quantity = np.broadcast_to(np.asarray(option_quantity, dtype=float), options.premium.shape)
+        base = options.premium
+        ds, dv, dr = (x.ravel() for x in np.meshgrid(spot, vol, rate, indexing='ij'))
+
+        # blocks span as many scenarios as fit in the budget, then as many options as fit with them
+        cells = max(1, budget // _CELL_BYTES)
+        scenarios = min(len(ds), cells)
+        positions = max(1, cells // scenarios)
+        blocks = [(i, j) for i in range(0, len(ds), scenarios) for j in range(0, len(base), positions)]
+        jobs = ([x[j:j + positions] for x in terms] + [quantity[j:j + positions], base[j:j + positions],
+                                                       ds[i:i + scenarios], dv[i:i + scenarios], dr[i:i + scenarios]]
+                for i, j in blocks)
+
+        flat = cube.reshape(-1)
+        if processes is None:
+            results = map(_reprice, jobs)
+            for (i, _), result in zip(blocks, results):
+                flat[i:i + scenarios] += result
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                for (i, _), result in zip(blocks, pool.map(_reprice, jobs)):
+                    flat[i:i + scenarios] += result
+    return cube
@@ -0,0 +1,165 @@
+from typing import Sequence
+
+import numpy as np
+from numpy.polynomial import polynomial
+
+from calc.option import CONVERGED
+
+# degree of the smile polynomials of total implied variance in log-moneyness
+DEGREE = 3
+
+
+def fit_smile(k: np.ndarray, w: np.ndarray, weights: np.ndarray = None):
+    """
+    Fit a smile of total implied variance, cubic in log-moneyness, by (weighted) least squares.
+    The degree is lowered when there are too few quotes to fit a cubic.
+
+    :param k: log-moneyness ln(K / F)
+    :param w: total implied variances sigma ** 2 * T
+    :param weights: weights of the quotes, applied to the residuals
+    :return: DEGREE + 1 polynomial coefficients, lowest power first
+    """
+    if len(k) == 0:
+        raise ValueError("at least one quote is needed to fit a smile")
+    coef = np.zeros(DEGREE + 1)
+    degree = min(DEGREE, len(k) - 1)
+    coef[:degree + 1] = polynomial.polyfit(k, w, degree, w=weights)
+    return coef
+
+
+class VolSurface(object):
+    """
+    Represents a black-scholes implied volatility surface, built expiry by expiry from implied volatilities.
+    The smile of each expiry is a polynomial of total implied variance (sigma ** 2 * T) in log-moneyness ln(K / F),
+    held flat beyond the log-moneyness of the quotes it was fitted to.
+    Between expiries, total variance is interpolated linearly in time at fixed log-moneyness,
+    and forwards are interpolated log-linearly.
+    Before the first and after the last expiry, the implied volatilities of the nearest smile are kept.
+    Smile coefficients are kept in one table, row by row in increasing order of expiries,
+    so that lookups of arrays of (K, T) are a binary search and two polynomial evaluations per point,
+    and refitting an expiry only recomputes its own row.
+    """
+
+    def __init__(self):
+        """
+        construct an empty volatility surface, to be filled by <fit>
+        """
+        self._T = np.empty(0)
+        self._F = np.empty(0)
+        self._coef = np.empty((0, DEGREE + 1))
+        self._kmin = np.empty(0)
+        self._kmax = np.empty(0)
+
+    @classmethod
+    def from_chains(cls, chains: Sequence[dict]):
+        """
+        build a volatility surface from option chains calibrated by <calc.chain.calibrate>
+
+        :param chains: calibration results, one per expiry
+        :return: volatility surface
+        """
+        surface = cls()
+        for chain in chains:
+            ok = chain['status'] == CONVERGED
+            surface.fit(float(chain['T']), float(chain['forward']), chain['strike'][ok], chain['sigma'][ok])
+        return surface
+
+    def fit(self, T: float, F: float, K: np.ndarray, sigma: np.ndarray, weights: np.ndarray = None):
+        """
+        fit the smile of an expiry, replacing its previous smile if the expiry is already part of the surface
+
+        :param T: time to maturity
+        :param F: forward price
+        :param K: strikes
+        :param sigma: implied volatilities
+        :param weights: weights of the quotes, e.g. vegas
+        :return:
+        """
+        if T <= 0:
+            raise ValueError("time to maturity must be positive")
+        k = np.log(np.asarray(K, dtype=float) / F)
+        coef = fit_smile(k, np.asarray(sigma, dtype=float) ** 2 * T, weights)
+        row = (T, F, coef, k.min(), k.max())
+
+        i = int(np.searchsorted(self._T, T))
+        if i < len(self._T) and np.isclose(self._T[i], T):
+            for table, value in zip((self._T, self._F, self._coef, self._kmin, self._kmax), row):
+                table[i] = value
+        else:
+            self._T, self._F, self._coef, self._kmin, self._kmax = (
+                np.insert(table, i, value, axis=0)
+                for table, value in zip((self._T, self._F, self._coef, self._kmin, self._kmax), row))
+
+    @property
+    def expiries(self):
+        return self._T
+
+    @property
+    def forwards(self):
+        return self._F
+
+    @property
+    def coefficients(self):
+        """
+        smile coefficients, one row per expiry, lowest power first
+
+        :return:
+        """
+        return self._coef
+
+    def forward(self, T):
+        """
+        forward prices at the given times to maturity
+
+        :param T: times to maturity
+        :return:
+        """
+        return np.exp(np.interp(T, self._T, np.log(self._F)))
+
+    def __smile__(self, i: np.ndarray, k: np.ndarray):
+        """
+        total implied variances of the smiles of the given expiries
+
+        :param i: positions of the expiries
+        :param k: log-moneyness
+        :return:
+        """
+        k = np.clip(k, self._kmin[i], self._kmax[i])
+        coef = self._coef[i]
+        w = coef[..., DEGREE]
+        for j in range(DEGREE - 1, -1, -1):
+            w = w * k + coef[..., j]
+        return w
+
+    def variance(self, K, T):
+        """
+        total implied variances sigma ** 2 * T at the given strikes and times to maturity
+
+        :param K: strikes
+        :param T: times to maturity
+        :return:
+        """
+        if not len(self._T):
+            raise ValueError("volatility surface is empty")
+        K, T = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(T, dtype=float))
+        k = np.log(K / self.forward(T))
+        n = len(self._T)
+        i = np.clip(np.searchsorted(self._T, T) - 1, 0, max(n - 2, 0))
+        j = np.minimum(i + 1, n - 1)
+        t0, t1 = self._T[i], self._T[j]
+        w0, w1 = self.__smile__(i, k), self.__smile__(j, k)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a = np.where(t1 > t0, (T - t0) / (t1 - t0), 0.)
+        w = np.where(T < t0, w0 * T / t0,
+                     np.where(T > t1, w1 * T / t1, (1 - a) * w0 + a * w1))
+        return np.maximum(w, 0)
+
+    def sigma(self, K, T):
+        """
+        implied volatilities at the given strikes and times to maturity
+
+        :param K: strikes
+        :param T: times to maturity
+        :return:
+        """
+        return np.sqrt(self.variance(K, T) / T)
@@ -1,54 +1,104 @@
-from typing import Sequence
+import os
 
 import numpy as np
 
+from calc.optimize import root_vec
 
-def pv(y: float, C: Sequence[float], due=False):
+# columns of amortization schedules
+SCHEDULE = ('payment', 'interest', 'principal', 'prepayment', 'balance')
+
+
+def flows(C):
+    """
+    Arrange cash flows as a matrix with one stream per row.
+    Ragged streams (sequences of sequences of different lengths) are padded with zeros.
+
+    :param C: one stream of cash flows, a matrix of streams, or a sequence of streams of different lengths
+    :return: matrix of cash flows, length of each stream, and whether a single stream was given
     """
-    Compute the present value of a set of cash flows
+    try:
+        C = np.asarray(C, dtype=float)
+    except ValueError:
+        lengths = np.array([len(c) for c in C], dtype=int)
+        matrix = np.zeros((len(C), lengths.max(initial=0)))
+        matrix[np.arange(matrix.shape[1]) < lengths[:, None]] = np.concatenate([np.ravel(c) for c in C])
+        return matrix, lengths, False
+    if C.ndim == 1:
+        return C[None, :], np.array([C.size]), True
+    return C, np.full(len(C), C.shape[1]), False
+
 
-    :param y: yield
-    :param C: cash received
+def pv(y, C, due=False):
+    """
+    Compute the present value of a set of cash flows, or of many streams of cash flows at once
+
+    :param y: yield, or one yield per stream, or several yields of a single stream
+    :param C: cash received, see <flows>
     :param due: True if the first flow occurs at the present time, or the next period otherwise
-    :return: present value of cash flow
+    :return: present value of cash flow, one per stream if several streams are given, or one per yield
     """
-    disc = np.power(1 + y, -np.arange(len(C)) - (0 if due else 1))
-    return np.sum(disc * C)
+    C, _, single = flows(C)
+    y = np.asarray(y, dtype=float)
+    single = single and y.ndim == 0
+    y = y[..., None]
+    disc = np.power(1 + y, -np.arange(C.shape[1]) - (0 if due else 1))
+    value = np.sum(disc * C, axis=-1)
+    return value[0] if single else value
 
 
-def fv(y: float, C: Sequence[float]):
+def fv(y, C, n=None):
     """
-    Compute the future value of a set of cash flows
-    :param y:
-    :param C:
-    :return:
+    Compute the future value of a set of cash flows, or of many streams of cash flows at once,
+    at the date of the last flow of each stream.
+    Earlier flows are compounded forward to that date.
+
+    :param y: yield, or one yield per stream, or several yields of a single stream
+    :param C: cash received, see <flows>
+    :param n: number of flows of each stream, for matrices of streams padded to the same length
+    :return: future value of cash flow, one per stream if several streams are given, or one per yield
     """
-    disc = np.power(1 + y, -np.arange(0, len(C))[::-1])
-    return np.sum(disc * C)
+    C, lengths, single = flows(C)
+    if n is not None:
+        lengths = np.broadcast_to(np.asarray(n, dtype=int), lengths.shape)
+    y = np.asarray(y, dtype=float)
+    single = single and y.ndim == 0
+    y = y[..., None]
+    growth = np.power(1 + y, (lengths - 1)[:, None] - np.arange(C.shape[1]))
+    value = np.sum(np.where(np.arange(C.shape[1]) < lengths[:, None], growth * C, 0), axis=-1)
+    return value[0] if single else value
 
 
-def compound2(r: float, m: int, n: int = 0):
+def compound2(r, m, n=0):
     """
     Convert an interest rate compounded m times per annum
-    into the equivalent rate compounded n times per annum
+    into the equivalent rate compounded n times per annum.
+    Rates and compound periods may be arrays and are broadcast against each other.
 
     :param r: interest rate
     :param m: compound periods per annum of input, 0 for continuous compounding
     :param n: compound periods per annum of output, 0 for continuous compounding
     :return:
     """
-    if m == n:
-        return r
-    c = r if m == 0 else m * np.log(1 + r / m)
-    if n == 0:
-        return c
-    return n * (np.exp(c / n) - 1)
+    if np.ndim(r) == np.ndim(m) == np.ndim(n) == 0:
+        if m == n:
+            return r
+        c = r if m == 0 else m * np.log(1 + r / m)
+        if n == 0:
+            return c
+        return n * (np.exp(c / n) - 1)
 
+    r, m, n = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(m, dtype=float), np.asarray(n, dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = np.where(m == 0, r, m * np.log1p(r / m))
+        out = np.where(n == 0, c, n * np.expm1(c / n))
+    return np.where(m == n, r, out)
 
-def amortize(PV: float, n: int, r: float, m: int = 12):
+
+def amortize(PV, n, r, m=12):
     """
     Compute the level payment of fully amortized traditional mortgages.
-    Note that r is bond-equivalent if m = 2, or mortgage-equivalent if m = 12
+    Note that r is bond-equivalent if m = 2, or mortgage-equivalent if m = 12.
+    All parameters may be arrays, one element per mortgage.
 
     <! WARNING: outdated comments>
     Newton's method is used to find the solution.
@@ -65,9 +115,180 @@ def amortize(PV: float, n: int, r: float, m: int = 12):
     :param m: compound period
     :return: level payment of fully amortized mortgage
     """
+    PV, n, r, m = (np.asarray(x, dtype=float) for x in (PV, n, r, m))
     y = 1 + r / m
     return PV * r / m / (1 - y ** (-m * n))
 
 
+def amortization(PV, n, r, m=12):
+    """
+    Compute the full amortization schedules of many fully amortized traditional mortgages at once.
+    Schedules are padded with zeros after the last payment of shorter mortgages.
+
+    :param PV: present values of original balances
+    :param n: maturities in years
+    :param r: annual interest rates
+    :param m: compound periods
+    :return: payments, interest, principal and balances after each payment,
+             each an array with one row per mortgage and one column per period
+    """
+    PV, n, r, m = (a.ravel() for a in np.broadcast_arrays(np.asarray(PV, dtype=float), np.asarray(n, dtype=float),
+                                                            np.asarray(r, dtype=float), np.asarray(m, dtype=float)))
+    N = np.rint(n * m).astype(int)
+    y = (1 + r / m)[:, None]
+    k = np.arange(N.max(initial=0) + 1)
+    yN = y ** N[:, None]
+    balance = np.where(k <= N[:, None], PV[:, None] * (yN - y ** k) / (yN - 1), 0)
+    interest = balance[:, :-1] * (r / m)[:, None]
+    principal = balance[:, :-1] - balance[:, 1:]
+    return interest + principal, interest, principal, balance[:, 1:]
+
+
+def irr(C, guess=0.1, lower=-0.9, upper=1., epsilon=10e-9, stop=100):
+    """
+    Compute the internal rates of return (per period) of many streams of cash flows at once,
+    the first flow of each stream occurring at the present time.
+    Every stream is solved simultaneously by <root_vec>, by the newton's method safeguarded by bisection
+    within [lower, upper] when the present values at the two ends have opposite signs.
+
+    :param C: streams of cash flows, see <flows>
+    :param guess: initial guess
+    :param lower: lower end of the bracket of the rates
+    :param upper: upper end of the bracket of the rates
+    :param epsilon: largest permissible present value and step at the solution
+    :param stop: maximum iterations
+    :return: internal rates of return and convergence flags, one per stream
+             (scalars if a single stream is given)
+    """
+    C, _, single = flows(C)
+    t = np.arange(C.shape[1])
+
+    def f(x, i):
+        return np.sum(C[i] * np.power(1 + x[:, None], -t), axis=-1)
+
+    def df(x, i):
+        return np.sum(-t * C[i] * np.power(1 + x[:, None], -t - 1), axis=-1)
+
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        y, converged, _, _ = root_vec(f, np.full(len(C), guess, dtype=float), df, epsilon=epsilon, delta=epsilon,
+                                      stop=stop, lower=lower, upper=upper, tag='irr')
+    return (y[0], converged[0]) if single else (y, converged)
+
+
+def smm(periods: int, cpr=0., psa: float = None, m: int = 12):
+    """
+    Compute the single monthly mortality (the fraction of the balance prepaid in each period),
+    from a constant prepayment rate or a PSA prepayment speed.
+    The PSA benchmark (100 PSA) ramps the annual rate up by 0.2% per month to 6% at month 30, then holds it.
+
+    :param periods: number of periods
+    :param cpr: conditional prepayment rate per annum, or one rate per period
+    :param psa: PSA speed in percent of the benchmark, e.g. 150, used instead of cpr if given
+    :param m: periods per annum
+    :return: fraction of the balance prepaid in each period
+    """
+    if psa is not None:
+        months = np.arange(1, periods + 1) * 12 / m
+        cpr = 0.06 * psa / 100 * np.minimum(months / 30, 1)
+    return 1 - np.power(1 - np.broadcast_to(np.asarray(cpr, dtype=float), (periods,)), 1 / m)
+
+
+def schedules(PV, n, r, m=12, cpr=0., psa: float = None, block: int = 4096, out: str = None):
+    """
+    Generate the amortization schedules of many mortgages with prepayments, in blocks of mortgages,
+    so that memory use does not depend on the number of mortgages.
+    Each period, the level payment is recomputed from the remaining balance and term,
+    and a fraction of the balance left after the scheduled principal is prepaid, see <smm>.
+    Schedules are padded with zeros after the last payment of shorter mortgages.
+    If an output directory is given, each column is also written to a memory-mapped .npy file of its own
+    (e.g. payment.npy), with one row per mortgage and one column per period.
+
+    :param PV: present values of original balances
+    :param n: maturities in years
+    :param r: annual interest rates
+    :param m: compound periods per annum, shared by every mortgage
+    :param cpr: conditional prepayment rate per annum, or one rate per period
+    :param psa: PSA speed in percent of the benchmark, used instead of cpr if given
+    :param block: mortgages per block
+    :param out: output directory, or None
+    :return: generator of (index of the first mortgage of the block, dictionary of SCHEDULE arrays)
+    """
+    PV, n, r = (a.ravel() for a in np.broadcast_arrays(
+        np.asarray(PV, dtype=float), np.asarray(n, dtype=float), np.asarray(r, dtype=float)))
+    N = np.rint(n * m).astype(int)
+    periods = int(N.max(initial=0))
+    prepaid = smm(periods, cpr, psa, m)
+
+    files = None
+    if out is not None:
+        os.makedirs(out, exist_ok=True)
+        files = {name: np.lib.format.open_memmap(os.path.join(out, name + '.npy'), mode='w+',
+                                                 shape=(len(PV), periods)) for name in SCHEDULE}
+    try:
+        for start in range(0, len(PV), block):
+            end = min(start + block, len(PV))
+            columns = _schedule(PV[start:end], N[start:end], r[start:end] / m, prepaid)
+            if files is not None:
+                for name in SCHEDULE:
+                    files[name][start:end] = columns[name]
+            yield start, columns
+    finally:
+        if files is not None:
+            for file in files.values():
+                file.flush()
+
+
+def _schedule(PV: np.ndarray, N: np.ndarray, y: np.ndarray, prepaid: np.ndarray):
+    """
+    amortization schedules of a block of mortgages
+
+    :param PV: present values of original balances
+    :param N: numbers of payments
+    :param y: interest rates per period
+    :param prepaid: fraction of the balance prepaid in each period
+    :return: dictionary of SCHEDULE arrays
+    """
+    columns = {name: np.zeros((len(PV), len(prepaid))) for name in SCHEDULE}
+    balance = PV.copy()
+    for k in range(len(prepaid)):
+        remaining = N - k
+        alive = remaining > 0
+        interest = balance * y
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payment = np.where(y > 0, interest / (1 - np.power(1 + y, -remaining)), balance / remaining)
+        payment = np.where(alive, payment, 0)
+        interest = np.where(alive, interest, 0)
+        principal = payment - interest
+        prepayment = prepaid[k] * (balance - principal)
+        balance = balance - principal - prepayment
+        for name, value in zip(SCHEDULE, (payment, interest, principal, prepayment, balance)):
+            columns[name][:, k] = value
+    return columns
+
+
+def pool(PV, n, r, m=12, cpr=0., psa: float = None, block: int = 4096):
+    """
+    Project the aggregate cash flows of a pool of mortgages with prepayments, see <schedules>,
+    summing the schedules block by block so that memory use does not depend on the size of the pool.
+
+    :param PV: present values of original balances
+    :param n: maturities in years
+    :param r: annual interest rates
+    :param m: compound periods per annum
+    :param cpr: conditional prepayment rate per annum, or one rate per period
+    :param psa: PSA speed in percent of the benchmark, used instead of cpr if given
+    :param block: mortgages per block
+    :return: dictionary of SCHEDULE arrays, one element per period
+    """
+    total = None
+    for _, columns in schedules(PV, n, r, m, cpr, psa, block):
+        if total is None:
+            total = {name: value.sum(axis=0) for name, value in columns.items()}
+        else:
+            for name, value in columns.items():
+                total[name] += value.sum(axis=0)
+    return total
+
+
 if __name__ == '__main__':
     print(amortize(250000, 15, 0.08))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from calc import kernels
+from calc.bond import BondBook
+from calc.option import VanillaBatch
+
+pytestmark = pytest.mark.skipif(kernels.numba is None, reason="numba is not installed")
+
+
+@pytest.fixture
+def options():
+    rng = np.random.default_rng(0)
+    n = 200
+    return (100., rng.uniform(50, 150, n), rng.uniform(0.05, 3, n), rng.uniform(0, 0.08, n),
+            rng.uniform(0.05, 0.8, n), rng.uniform(0, 0.04, n), rng.random(n) < 0.5)
+
+
+@pytest.fixture
+def book():
+    rng = np.random.default_rng(1)
+    n = 100
+    return BondBook(rng.integers(1, 31, n).astype(float), rng.uniform(0, 8, n), m=rng.choice([1, 2, 4], n),
+                    y=rng.uniform(0, 0.1, n))
+
+
+def test_vanilla_parity(options):
+    expected = kernels.vanilla(*options, backend=kernels.NUMPY)
+    values = kernels.vanilla(*options, backend=kernels.NUMBA)
+    np.testing.assert_allclose(values, expected, rtol=1e-10, atol=1e-12)
+
+
+def test_vanilla_batch_backends(options, monkeypatch):
+    compiled = VanillaBatch(*options)
+    monkeypatch.setattr(kernels, 'BACKEND', kernels.NUMPY)
+    fallback = VanillaBatch(*options)
+    for name in compiled.greeks():
+        np.testing.assert_allclose(getattr(compiled, name), getattr(fallback, name), rtol=1e-10, atol=1e-12)
+
+
+def test_vanilla_output_buffer(options):
+    out = np.empty((len(kernels.VANILLA), len(options[1])))
+    values = kernels.vanilla(*options, out=out, backend=kernels.NUMBA)
+    assert np.shares_memory(values, out)
+    with pytest.raises(ValueError):
+        kernels.vanilla(*options, out=out[:, 1:], backend=kernels.NUMBA)
+
+
+def test_bonds_parity(book):
+    expected = kernels.bonds(book.ts, book.cs, book.indptr, book.y, backend=kernels.NUMPY)
+    values = kernels.bonds(book.ts, book.cs, book.indptr, book.y, backend=kernels.NUMBA)
+    np.testing.assert_allclose(values, expected, rtol=1e-12)
+    np.testing.assert_allclose(values, np.stack([book.B, book.duration, book.convexity]), rtol=1e-12)
+
+
+def test_book_backends(book, monkeypatch):
+    monkeypatch.setattr(kernels, 'BACKEND', kernels.NUMPY)
+    fallback = BondBook(book.T, book.R, book.m, y=book.y, F=book.F)
+    for name in ('B', 'duration', 'convexity', 'dv01'):
+        np.testing.assert_allclose(getattr(book, name), getattr(fallback, name), rtol=1e-12)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from scipy.stats import norm
+
+from calc.special import ncdf, npdf
+
+# points across the body and both tails of the distribution
+POINTS = np.concatenate([np.linspace(-37, 37, 7401), [-30., -10., -1e-3, 0., 1e-3, 10.]])
+RTOL = 1e-12
+
+
+def test_ncdf_array():
+    np.testing.assert_allclose(ncdf(POINTS), norm.cdf(POINTS), rtol=RTOL, atol=0)
+
+
+def test_npdf_array():
+    np.testing.assert_allclose(npdf(POINTS), norm.pdf(POINTS), rtol=RTOL, atol=0)
+
+
+@pytest.mark.parametrize("x", [-37., -30., -8., -1., -1e-3, 0., 1e-3, 1., 8., 30.])
+def test_scalar(x):
+    assert isinstance(ncdf(x), float) and isinstance(npdf(x), float)
+    assert ncdf(x) == pytest.approx(norm.cdf(x), rel=RTOL, abs=0)
+    assert npdf(x) == pytest.approx(norm.pdf(x), rel=RTOL, abs=0)
+
+
+def test_numpy_scalar_and_list():
+    assert ncdf(np.float64(-5.)) == pytest.approx(norm.cdf(-5.), rel=RTOL)
+    np.testing.assert_allclose(ncdf([-5., 0., 5.]), norm.cdf([-5., 0., 5.]), rtol=RTOL, atol=0)
+
+
+def test_left_tail_keeps_relative_accuracy():
+    # 1 - ncdf(-x) would round to 0 or 1; the left tail must stay positive and accurate
+    x = np.array([-20., -30., -37.])
+    assert np.all(ncdf(x) > 0)
+    np.testing.assert_allclose(ncdf(x), norm.sf(-x), rtol=RTOL, atol=0)